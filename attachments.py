@@ -0,0 +1,114 @@
+# attachments.py
+# Streams image attachments with a size cap and shrinks them in worker threads before they go to Gemini
+
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+import http_client
+from caches import ByteLRUCache
+
+logger = logging.getLogger(__name__)
+
+max_pixels = 40_000_000     # refuse decompression bombs no matter what the byte size is
+
+
+def header_size(data):
+    """Read an image's (width, height) from the start of its bytes, or None if it can't be read yet"""
+    from PIL import Image
+    try:
+        return Image.open(BytesIO(data)).size
+    except Exception:
+        return None
+
+
+def shrink(data, max_side, quality=85):
+    """Decode an image, downscale it to fit max_side and re-encode it as JPEG. Runs in a worker thread."""
+    from PIL import Image
+    image = Image.open(BytesIO(data))
+    image.draft("RGB", (max_side, max_side))    # lets JPEGs decode at a reduced size directly
+    image.thumbnail((max_side, max_side), Image.LANCZOS)
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    buffer = BytesIO()
+    image.save(buffer, "JPEG", quality=quality, optimize=True)
+    return buffer.getvalue()
+
+
+class AttachmentLoader:
+    """Downloads and shrinks image attachments, remembering results by attachment id"""
+
+    def __init__(self, max_bytes=10 * 1024 * 1024, max_side=1536, workers=2, cache_bytes=64 * 1024 * 1024, retry=None):
+        self.retry = retry      # optional wrapper that retries a download, e.g. with backoff
+        self.max_bytes = max_bytes
+        self.max_side = max_side
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="attachments")
+        self.cache = ByteLRUCache(max_bytes=cache_bytes)
+
+    async def load(self, attachment):
+        """Return JPEG bytes for an image attachment, or None if it isn't an image we accept"""
+        cached = self.cache.get(attachment.id)
+        if cached is not None:
+            return cached
+
+        # Reject what we can from the metadata Discord already sent, before connecting at all
+        if attachment.content_type and not attachment.content_type.startswith("image/"):
+            return None
+        if attachment.size > self.max_bytes:
+            logger.info("Skipping attachment over the size limit",
+                        extra={"attachment": attachment.filename, "bytes": attachment.size})
+            return None
+        if attachment.width and attachment.height and attachment.width * attachment.height > max_pixels:
+            logger.info("Skipping attachment over the pixel limit",
+                        extra={"attachment": attachment.filename, "width": attachment.width, "height": attachment.height})
+            return None
+
+        if self.retry is not None:
+            data = await self.retry(lambda: self.download(attachment.url))
+        else:
+            data = await self.download(attachment.url)
+        if data is None:
+            return None
+        loop = asyncio.get_running_loop()
+        shrunk = await loop.run_in_executor(self.executor, shrink, data, self.max_side)
+        self.cache.set(attachment.id, shrunk)
+        return shrunk
+
+    async def download(self, url):
+        """Stream an image, giving up as soon as the headers or the first bytes show it's unacceptable"""
+        async with http_client.get_session().get(url) as resp:
+            resp.raise_for_status()
+            if not resp.content_type.startswith("image/"):
+                logger.info("Skipping attachment that isn't an image", extra={"content_type": resp.content_type})
+                return None
+            if resp.content_length is not None and resp.content_length > self.max_bytes:
+                logger.info("Skipping attachment over the size limit", extra={"bytes": resp.content_length})
+                return None
+            buffer = bytearray()
+            size = None
+            async for chunk in resp.content.iter_chunked(64 * 1024):
+                buffer += chunk
+                if len(buffer) > self.max_bytes:
+                    logger.info("Skipping attachment: download went over the size limit")
+                    return None
+                if size is None and len(buffer) <= 256 * 1024:
+                    size = header_size(bytes(buffer))
+                    if size is not None and size[0] * size[1] > max_pixels:
+                        logger.info("Skipping attachment over the pixel limit",
+                                    extra={"width": size[0], "height": size[1]})
+                        return None
+            return bytes(buffer)
+
+    async def load_all(self, attachments):
+        """Load every attachment concurrently and return the JPEG bytes of the ones that are images"""
+        results = await asyncio.gather(*(self.load(attachment) for attachment in attachments), return_exceptions=True)
+        loaded = []
+        for attachment, result in zip(attachments, results):
+            if isinstance(result, Exception):
+                logger.warning("Attachment failed", extra={"attachment": attachment.filename, "error": str(result)})
+            elif result is not None:
+                loaded.append(result)
+        return loaded
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
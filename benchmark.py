@@ -0,0 +1,529 @@
+# benchmark.py
+# Offline microbenchmarks for the bot's hot paths
+#
+# Usage:
+#   python3 benchmark.py spelling [--messages N]
+#   python3 benchmark.py routing [--messages N]
+#   python3 benchmark.py startup [--runs N]
+#   python3 benchmark.py load [--messages N] [--rate R] [--trace FILE]
+#   python3 benchmark.py members [--members N]
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+# Synthetic chat lines in the style our servers see, including urls, mentions and emoji
+sample_messages = [
+    "M! can you make me an imgae of a cat riding a skateboard",
+    "lol that game last night was wild",
+    "<@1354446865919377570> draw a pictrue of a sunset over the mountains",
+    "m? whats the best time to play https://example.com/some/long/path?query=1",
+    "hey guys :fire: :fire: anyone up for a game later",
+    "!M make a cartooon of my dog <:pepe:123456789012345678>",
+    "I think the photgraph came out pretty good tbh",
+    "sup everyone, how was your weekend",
+]
+
+
+def make_messages(count, seed=0):
+    rng = random.Random(seed)
+    return [rng.choice(sample_messages) for _ in range(count)]
+
+
+def time_per_message(func, messages):
+    """Run func on every message and return the average seconds per message"""
+    start = time.perf_counter()
+    for text in messages:
+        func(text)
+    return (time.perf_counter() - start) / len(messages)
+
+
+def bench_spelling(args):
+    """Compare the original per-message Speller against the cached and trigger-only modes"""
+    import spelling
+    from commands import trigger_words
+
+    def before(text):
+        # The original correct_token: a fresh Speller for every message and a lookup for every token
+        from autocorrect import Speller
+        spell = Speller()
+        return [spell(word) or word for word in text.split()]
+
+    messages = make_messages(args.messages)
+    before_messages = messages[:max(1, args.messages // 100)]   # the old path is too slow to run in full
+
+    results = [("before (new Speller per message)", time_per_message(before, before_messages))]
+    spelling.get_speller()   # load the model once, like the bot does on its first message
+    for mode in ("full", "triggers"):
+        def uncached(text):
+            spelling.clear_cache()
+            return spelling.correct_tokens(text, trigger_words, mode=mode)
+
+        cold = time_per_message(uncached, messages[:max(1, args.messages // 10)])
+        warm = time_per_message(lambda text: spelling.correct_tokens(text, trigger_words, mode=mode), messages)
+        results.append((f"{mode} (empty word cache)", cold))
+        results.append((f"{mode} (warm word cache)", warm))
+
+    print(f"Spell correction cost per message ({args.messages} synthetic messages)")
+    for name, seconds in results:
+        print(f"  {name:<36} {seconds * 1e6:>12.1f} us")
+
+    # Regression check: real words must never turn into trigger words (that would send chat to the image model),
+    # while typos of trigger words still should
+    words = spelling.get_speller().nlp_data
+    common = sorted(words, key=words.get, reverse=True)[:args.common_words]
+    common += ["lecture", "mixture", "pointing", "printing", "growing", "cartons"]
+    changed = [(word, match) for word in common
+               for match in spelling.correct_tokens(word, trigger_words) if match.lower() != word.lower()]
+    typos = {"pictrue": "picture", "imgae": "image", "drawign": "drawing", "paintng": "painting", "phtoo": "photo"}
+    missed = [typo for typo, expected in typos.items() if spelling.correct_tokens(typo, trigger_words) != [expected]]
+    print(f"Trigger matching: {len(common) - len(changed)}/{len(common)} common words left alone, "
+          f"{len(typos) - len(missed)}/{len(typos)} typos corrected")
+    if changed or missed:
+        raise SystemExit(f"Spelling regression: changed {changed[:20]}, missed {missed}")
+
+
+def make_discord_messages(count, bot_user, seed=0):
+    """Discord message stand-ins: mostly chatter, with some prefixed, mentioning and replying messages"""
+    rng = random.Random(seed)
+    bot_message = SimpleNamespace(author=bot_user)
+    other_message = SimpleNamespace(author=SimpleNamespace(id=42))
+    messages = []
+    for _ in range(count):
+        roll = rng.random()
+        content = rng.choice([sample_messages[i] for i in (1, 4, 6, 7)])   # chatter with no prefix
+        reference = None
+        if roll < 0.05:
+            content = f"<@{bot_user.id}> {content}"
+        elif roll < 0.10:
+            reference = SimpleNamespace(resolved=bot_message)
+        elif roll < 0.20:
+            reference = SimpleNamespace(resolved=other_message)
+        elif roll < 0.25:
+            content = "M! " + content
+        messages.append(SimpleNamespace(content=content, reference=reference, mention_everyone=False,
+                                        mentions=[bot_user] if content.startswith("<@") else []))
+    return messages
+
+
+def bench_routing(args):
+    """Compare the original on_message trigger checks against the compiled router"""
+    import commands
+    from router import Router
+
+    bot_user = SimpleNamespace(id=1354446865919377570)
+    messages = make_discord_messages(args.messages, bot_user)
+
+    def before(message):
+        # The original checks: dice rolls, exact commands, then the prefix/mention/reply condition
+        commands.random_chance(0.05)
+        commands.random_chance(0.05)
+        message.content == '!!@@'
+        message.content == '99!'
+        return any([prefix in message.content for prefix in commands.prefixes]) or \
+            bot_user in message.mentions or \
+            (not message.mention_everyone and hasattr(message, "reference"))
+
+    async def handler(message):
+        pass
+
+    router = Router(commands.prefixes)
+    router.random(0.05)(handler)
+    router.random(0.05)(handler)
+    router.command('!!@@')(handler)
+    router.command('99!')(handler)
+    router.addressed(handler)
+
+    before_addressed = sum(1 for message in messages if before(message))
+    after_addressed = sum(1 for message in messages if router.is_addressed(message, bot_user))
+    before_seconds = time_per_message(before, messages)
+    after_seconds = time_per_message(lambda message: router.route(message, bot_user), messages)
+
+    print(f"Routing {args.messages} synthetic messages")
+    print(f"  {'':<28} {'us/message':>12} {'messages/s':>14} {'sent to Gemini':>16}")
+    print(f"  {'before (inline checks)':<28} {before_seconds * 1e6:>12.2f} {1 / before_seconds:>14,.0f} {before_addressed:>16}")
+    print(f"  {'after (compiled router)':<28} {after_seconds * 1e6:>12.2f} {1 / after_seconds:>14,.0f} {after_addressed:>16}")
+
+
+def bench_startup(args):
+    """Time `import bot` in fresh interpreters and list the slowest imports"""
+    heavy_modules = ["nltk", "PIL", "google.genai", "autocorrect"]
+    probe = (
+        "import time, sys; start = time.perf_counter(); import bot; "
+        "print(time.perf_counter() - start, "
+        f"','.join(name for name in {heavy_modules!r} if name in sys.modules))"
+    )
+    env = dict(os.environ, OFFLINE_MODE="true", GEMINI_KEY=os.getenv("GEMINI_KEY", "benchmark"))
+    here = os.path.dirname(os.path.abspath(__file__))
+
+    import_seconds = []
+    for _ in range(args.runs):
+        result = subprocess.run([sys.executable, "-c", probe], cwd=here, env=env,
+                                capture_output=True, text=True, check=True)
+        seconds, _, loaded = result.stdout.strip().splitlines()[-1].partition(" ")
+        import_seconds.append(float(seconds))
+
+    # One more run with -X importtime to find the modules that cost the most
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import bot"], cwd=here, env=env,
+                            capture_output=True, text=True, check=True)
+    timings = []
+    children = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        # Children are listed before their parent, so collect modules one level down until bot shows up
+        if depth == 1:
+            children.append((int(cumulative), name.strip()))
+        elif depth == 0:
+            if name.strip() == "bot":
+                timings = [(int(cumulative), "bot (total)")] + sorted(children, reverse=True)
+            children = []
+
+    import_seconds.sort()
+    print(f"import bot: median {import_seconds[len(import_seconds) // 2] * 1000:.0f} ms, "
+          f"best {import_seconds[0] * 1000:.0f} ms over {args.runs} runs")
+    print(f"Heavy modules loaded at import: {loaded or 'none'}")
+    print("Slowest imports made by bot.py:")
+    for cumulative, name in timings[:args.top + 1]:
+        print(f"  {cumulative / 1000:>8.1f} ms  {name}")
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))] if values else 0.0
+
+
+class FakeMessage:
+    def __init__(self, message_id, channel, content):
+        self.id = message_id
+        self.channel = channel
+        self.content = content
+
+    async def edit(self, content=None):
+        await asyncio.sleep(self.channel.latency)
+        self.channel.edits += 1
+        self.content = content
+        return self
+
+
+class FakeChannel:
+    """Stands in for a Discord channel; send() and edit() take `latency` seconds like a REST call would"""
+
+    def __init__(self, channel_id, latency):
+        self.id = channel_id
+        self.latency = latency
+        self.sent = 0
+        self.edits = 0
+
+    async def send(self, content=None, files=None):
+        await asyncio.sleep(self.latency)
+        self.sent += 1
+        return FakeMessage(self.sent, self, content)
+
+
+def load_trace(path):
+    """Read a JSON-lines trace: {"content": ..., "channel": id, "author": id, "at": seconds from start}.
+    Entries with "kind": "gif" go straight to get_gif; everything else goes through on_message."""
+    with open(path) as trace:
+        return [json.loads(line) for line in trace if line.strip()]
+
+
+def synthetic_trace(args):
+    """Messages arriving at args.rate per second (Poisson), mixing chatter, chat prompts, image prompts and GIFs"""
+    rng = random.Random(args.seed)
+    chatter = [sample_messages[i] for i in (1, 4, 6, 7)]     # lines with no prefix or mention
+    at = 0.0
+    trace = []
+    for _ in range(args.messages):
+        at += rng.expovariate(args.rate)
+        roll = rng.random()
+        if roll < args.image_share:
+            content, kind = f"M! make me an image of {rng.choice(['a cat', 'a dog', 'a sunset', 'a robot'])}", "image"
+        elif roll < args.image_share + args.chat_share:
+            content, kind = f"m? {rng.choice(chatter)} ({rng.randrange(args.distinct_prompts)})", "chat"
+        elif roll < args.image_share + args.chat_share + args.gif_share:
+            content, kind = rng.choice(chatter), "gif"
+        else:
+            content, kind = rng.choice(chatter), "chatter"
+        trace.append({"content": content, "channel": rng.randrange(args.channels), "author": rng.randrange(1000),
+                      "at": at, "kind": kind})
+    return trace
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def wait_for_port(port, timeout=10):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.05)
+
+
+async def run_load(args):
+    trace = load_trace(args.trace) if args.trace else synthetic_trace(args)
+
+    # The stubs run in their own process so they don't compete with the bot for the event loop
+    port = free_port()
+    stubs = subprocess.Popen(
+        [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "stub_servers.py"),
+         "--port", str(port), "--gemini-latency", str(args.gemini_latency),
+         "--image-latency", str(args.image_latency), "--tenor-latency", str(args.tenor_latency),
+         "--rate-limit", str(args.rate_limit), "--key-rpm", str(args.key_rpm)],
+        stdout=subprocess.DEVNULL,
+    )
+    try:
+        await wait_for_port(port)
+        base_url = f"http://127.0.0.1:{port}/"
+        os.environ.update(GEMINI_BASE_URL=base_url, TENOR_SEARCH_URL=base_url + "v2/search",
+                          GEMINI_KEYS=",".join(f"load-test-{index}" for index in range(args.keys)),
+                          GEMINI_RPM=str(args.key_rpm), TENOR_KEY="load-test", OFFLINE_MODE="true")
+        os.environ.setdefault("LOG_LEVEL", "ERROR")
+        os.environ.setdefault("CHAT_STORE_PATH", os.path.join(tempfile.mkdtemp(), "chat_history.db"))
+        import bot
+        import logs
+        import http_client
+        await run_trace(args, trace, bot, logs, http_client)
+    finally:
+        stubs.terminate()
+        stubs.wait()
+
+
+async def run_trace(args, trace, bot, logs, http_client):
+    bot_user = SimpleNamespace(id=1354446865919377570, name="Marcus")
+    bot.client._connection.user = bot_user      # what on_message compares authors and mentions against
+    await http_client.start()
+
+    # OFFLINE_MODE can't download the NLTK data, and without it get_gif returns before reaching the Tenor stub
+    if not bot.nlp.load(offline=True):
+        print("WARNING: NLTK data missing (run `python3 nlp.py` to vendor it); "
+              "GIF search terms come from a plain word split instead of the tagger")
+        bot.nlp.nouns = lambda text, offline=False: re.findall(r"[A-Za-z]{4,}", text)
+
+    # Record every reply the handlers queue, keyed by the message that caused it
+    replies = {}
+    first_sent = {}     # message -> when its first reply reached the channel
+    queue_send = bot.outbox.send
+
+    def tracked_send(channel, content=None, files=None):
+        request = logs.request_id.get()
+        future = queue_send(channel, content, files)
+        future.add_done_callback(lambda _: first_sent.setdefault(request, time.perf_counter()))
+        replies.setdefault(request, []).append(future)
+        return future
+    bot.outbox.send = tracked_send
+
+    channels = {}
+    latencies = {}      # kind -> seconds from arrival until every reply was sent
+    first_latencies = {}    # kind -> seconds from arrival until the first reply was sent
+    errors = 0
+
+    async def deliver(index, entry):
+        nonlocal errors
+        channel_id = entry.get("channel", 0)
+        channel = channels.get(channel_id)
+        if channel is None:
+            channel = channels[channel_id] = FakeChannel(channel_id, args.discord_latency)
+        message = SimpleNamespace(
+            id=index, content=entry["content"], channel=channel, guild=SimpleNamespace(id=1),
+            author=SimpleNamespace(id=entry.get("author", 0), name=f"user{entry.get('author', 0)}"),
+            attachments=[], reference=None, mention_everyone=False, mentions=[],
+        )
+        kind = entry.get("kind", "message")
+        latencies.setdefault(kind, [])
+        first_latencies.setdefault(kind, [])
+        logs.request_id.set(str(index))
+        start = time.perf_counter()
+        try:
+            await (bot.get_gif(message) if kind == "gif" else bot.on_message(message))
+            await asyncio.gather(*replies.pop(str(index), []))
+        except Exception:
+            errors += 1
+            return
+        latencies[kind].append(time.perf_counter() - start)
+        if str(index) in first_sent:
+            first_latencies[kind].append(first_sent.pop(str(index)) - start)
+
+    # Sample event loop lag ourselves so stalls show up as a max, not just a histogram bucket
+    lags = []
+
+    async def sample_lag(interval=0.05):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(interval)
+            lags.append(time.perf_counter() - start - interval)
+    lag_task = asyncio.create_task(sample_lag())
+
+    started = time.perf_counter()
+    tasks = []
+    for index, entry in enumerate(trace):
+        delay = started + entry.get("at", 0) - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(deliver(index, entry)))
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+    lag_task.cancel()
+
+    stub_stats = await http_client.get_json(os.environ["GEMINI_BASE_URL"] + "stats")
+    await bot.outbox.close()
+    await http_client.close()
+    bot.attachment_loader.shutdown()
+
+    handled = sum(len(values) for values in latencies.values())
+    offered_seconds = max(trace[-1].get("at", 0), 1e-9) if trace else 1e-9
+    print(f"Replayed {len(trace)} messages in {elapsed:.1f} s ({len(trace) / offered_seconds:.1f} messages/s offered, "
+          f"{handled / elapsed:.1f} messages/s handled, {errors} errors)")
+    print(f"  {'':<10} {'count':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9} {'first p50':>10} {'first p95':>10}")
+    everything = [value for values in latencies.values() for value in values]
+    every_first = [value for values in first_latencies.values() for value in values]
+    for kind, values, firsts in [("all", everything, every_first)] + \
+            [(kind, latencies[kind], first_latencies[kind]) for kind in sorted(latencies)]:
+        print(f"  {kind:<10} {len(values):>7} {percentile(values, 0.5) * 1000:>9.1f} "
+              f"{percentile(values, 0.95) * 1000:>9.1f} {percentile(values, 0.99) * 1000:>9.1f} "
+              f"{max(values, default=0) * 1000:>9.1f} {percentile(firsts, 0.5) * 1000:>10.1f} "
+              f"{percentile(firsts, 0.95) * 1000:>10.1f}")
+    print(f"Event loop lag: p99 {percentile(lags, 0.99) * 1000:.1f} ms, max {max(lags, default=0) * 1000:.1f} ms")
+    print(f"Peak RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MB")
+    print(f"Stub calls: {stub_stats}")
+    print(f"Coalescing: {bot.coalescer.stats()}")
+    print(f"Gemini pool: {bot.gemini_pool.stats()}")
+    print(f"Outbox: {bot.outbox.stats()}, edits: {sum(channel.edits for channel in channels.values())}")
+
+
+def member_payload(index):
+    return {"user": {"id": str(10 ** 17 + index), "username": f"user{index}", "discriminator": "0", "avatar": None,
+                     "global_name": f"User {index}"},
+            "roles": [], "joined_at": "2024-01-01T00:00:00+00:00", "deaf": False, "mute": False, "flags": 0}
+
+
+def measure_members(args):
+    """Connect a synthetic guild to the bot's client with one MEMBER_CACHE profile and print what it cost"""
+    os.environ.update(MEMBER_CACHE=args.profile, OFFLINE_MODE="true", LOG_LEVEL="ERROR")
+    import bot
+    from discord.state import ChunkRequest
+    state = bot.client._connection
+    guild_id = 1354446865919377000
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    guild = state._add_guild_from_data({
+        "id": str(guild_id), "name": "benchmark", "member_count": args.members, "channels": [], "members": [],
+        "emojis": [], "stickers": [], "roles": [{"id": str(guild_id), "name": "@everyone", "permissions": "0",
+                                                 "position": 0, "color": 0, "hoist": False, "managed": False,
+                                                 "mentionable": False}],
+    })
+    chunks = chunk_bytes = 0
+    if state._guild_needs_chunking(guild):
+        # What discord.py does for each guild before on_ready: request every member and cache the replies,
+        # which Discord sends 1000 members per GUILD_MEMBERS_CHUNK event
+        loop = asyncio.new_event_loop()
+        request = state._chunk_requests[guild_id] = ChunkRequest(guild_id, 0, loop, state._get_guild,
+                                                                 cache=state.member_cache_flags.joined)
+        count = (args.members + 999) // 1000
+        for index in range(count):
+            raw = json.dumps({"guild_id": str(guild_id), "chunk_index": index, "chunk_count": count,
+                              "nonce": request.nonce, "members": [member_payload(member) for member in
+                                                                  range(index * 1000, min(args.members, (index + 1) * 1000))]})
+            chunks += 1
+            chunk_bytes += len(raw)
+            state.parse_guild_members_chunk(json.loads(raw))
+        loop.close()
+    print(json.dumps({
+        "seconds": time.perf_counter() - start,
+        "chunks": chunks,
+        "chunk_mb": chunk_bytes / 1e6,
+        "cached": len(guild.members),
+        "rss_mb": (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before) / 1024,
+    }))
+
+
+def bench_members(args):
+    """Compare the startup cost of the full and slim MEMBER_CACHE profiles for one large guild"""
+    if args.profile:
+        return measure_members(args)
+    print(f"Connecting a guild with {args.members:,} members")
+    print(f"  {'profile':<8} {'chunk events':>13} {'chunk MB':>9} {'process s':>10} {'cached':>9} {'RSS +MB':>8}")
+    for profile in ("full", "slim"):
+        result = subprocess.run([sys.executable, os.path.abspath(__file__), "members", "--members", str(args.members),
+                                 "--profile", profile], capture_output=True, text=True, check=True)
+        numbers = json.loads(result.stdout.strip().splitlines()[-1])
+        print(f"  {profile:<8} {numbers['chunks']:>13} {numbers['chunk_mb']:>9.1f} {numbers['seconds']:>10.2f} "
+              f"{numbers['cached']:>9,} {numbers['rss_mb']:>8.1f}")
+
+
+def bench_load(args):
+    """Replay a message trace through on_message and get_gif against local Gemini and Tenor stubs"""
+    asyncio.run(run_load(args))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MarcusBot offline benchmarks")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    spelling_parser = subparsers.add_parser("spelling", help="spell-correction cost per message")
+    spelling_parser.add_argument("--messages", type=int, default=2000)
+    spelling_parser.add_argument("--common-words", type=int, default=20000,
+                                 help="most frequent dictionary words that must not be corrected into trigger words")
+    spelling_parser.set_defaults(func=bench_spelling)
+
+    routing_parser = subparsers.add_parser("routing", help="message routing throughput")
+    routing_parser.add_argument("--messages", type=int, default=200000)
+    routing_parser.set_defaults(func=bench_routing)
+
+    startup_parser = subparsers.add_parser("startup", help="import time of bot.py")
+    startup_parser.add_argument("--runs", type=int, default=5)
+    startup_parser.add_argument("--top", type=int, default=10)
+    startup_parser.set_defaults(func=bench_startup)
+
+    load_parser = subparsers.add_parser("load", help="end-to-end latency and throughput against local stub APIs")
+    load_parser.add_argument("--messages", type=int, default=500)
+    load_parser.add_argument("--rate", type=float, default=20, help="messages per second")
+    load_parser.add_argument("--trace", help="JSON-lines trace to replay instead of synthetic messages")
+    load_parser.add_argument("--channels", type=int, default=20)
+    load_parser.add_argument("--chat-share", type=float, default=0.15, help="fraction of messages addressed to the bot")
+    load_parser.add_argument("--image-share", type=float, default=0.03, help="fraction of messages asking for images")
+    load_parser.add_argument("--gif-share", type=float, default=0.05, help="fraction of messages answered with a GIF")
+    load_parser.add_argument("--distinct-prompts", type=int, default=50)
+    load_parser.add_argument("--gemini-latency", type=float, default=0.5)
+    load_parser.add_argument("--image-latency", type=float, default=2.0)
+    load_parser.add_argument("--tenor-latency", type=float, default=0.05)
+    load_parser.add_argument("--discord-latency", type=float, default=0.05)
+    load_parser.add_argument("--rate-limit", type=float, default=0.0, help="fraction of Gemini calls answered with 429")
+    load_parser.add_argument("--keys", type=int, default=1, help="Gemini API keys in the pool")
+    load_parser.add_argument("--key-rpm", type=int, default=0,
+                             help="requests per minute per key and model, enforced by the stub and the pool (0: none)")
+    load_parser.add_argument("--seed", type=int, default=0)
+    load_parser.set_defaults(func=bench_load)
+
+    members_parser = subparsers.add_parser("members", help="startup cost of caching every guild member")
+    members_parser.add_argument("--members", type=int, default=50000)
+    members_parser.add_argument("--profile", choices=["full", "slim"], help="measure one profile in this process")
+    members_parser.set_defaults(func=bench_members)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
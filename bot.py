@@ -10,33 +10,59 @@
 # 5. add "now that the niceties are out of the way, let's get to business"
 # 6. add functionality to scrape images from Microsoft Designer for image generation
 
+import time
+startup_started = time.perf_counter()   # used to report how long startup took
+
+import importlib
 import io
+import json
 import os
 import discord
 import random
-import requests
-import json
-import nltk
-import aiohttp
 import asyncio
-import datetime
-from nltk.tokenize import word_tokenize
-from nltk.tag import pos_tag
-from google import genai
-from google.genai import types
-from PIL import Image
-from io import BytesIO
-from autocorrect import Speller
+import logging
 from dotenv import load_dotenv
-from http.client import HTTPException
 load_dotenv()
 
 # Import additional custom commands
+import coalesce
 import commands
-
-# Download the necessary dependencies for nltk
-nltk.download('punkt_tab')
-nltk.download('averaged_perceptron_tagger_eng')
+import console
+import health
+import http_client
+import images
+import logs
+import metrics
+import nlp
+import retry
+from retry import retry_with_backoff
+import spelling
+import streaming
+import workqueue
+from attachments import AttachmentLoader
+from gemini_pool import GeminiPool
+from outbox import Outbox
+from prompts import PromptBuilder, PromptTooLongError
+from router import Router
+from scheduler import RequestScheduler
+from sessions import ChatSessionManager, estimate_tokens
+from store import ConversationStore
+from tenor import TenorClient
+
+imports_finished = time.perf_counter()
+startup_reported = False
+
+# Log JSON lines to stdout (LOG_FORMAT=text for plain lines)
+logs.setup(level=os.getenv('LOG_LEVEL', 'INFO'), log_format=os.getenv('LOG_FORMAT', 'json'))
+logger = logging.getLogger('marcus')
+
+# Serve Prometheus metrics on METRICS_HOST:METRICS_PORT (port 0 turns the endpoint off)
+metrics_port = int(os.getenv('METRICS_PORT', '0'))
+metrics_host = os.getenv('METRICS_HOST', '127.0.0.1')
+
+# NLTK, PIL and google-genai are slow to import, so they are loaded the first time they're needed.
+# With OFFLINE_MODE=true the bot never downloads NLTK data and only uses ./nltk_data or the local NLTK cache.
+offline_mode = os.getenv('OFFLINE_MODE', 'false').lower() == 'true'
 
 # Get Discord token
 discord_key = os.getenv('DISCORD_KEY')
@@ -47,21 +73,248 @@ google_key = os.getenv('GEMINI_KEY')
 # Get Tenor token
 tenor_key = os.getenv('TENOR_KEY')
 
+# Search Tenor through in-memory caches of results and GIF bytes
+tenor = TenorClient(
+    tenor_key,
+    search_ttl=int(os.getenv('TENOR_SEARCH_TTL', '3600')),
+    max_searches=int(os.getenv('TENOR_MAX_SEARCHES', '512')),
+    max_gif_bytes=int(os.getenv('TENOR_CACHE_MB', '32')) * 1024 * 1024,
+    search_url=os.getenv('TENOR_SEARCH_URL'),
+)
+tenor_prefetch = os.getenv('TENOR_PREFETCH', 'false').lower() == 'true'
+tenor_prefetch_task = None
+
+# "triggers" only fixes typos of commands.trigger_words, "full" spell-checks every word, "off" skips correction
+spell_mode = os.getenv('SPELL_MODE', 'triggers')
+
+# How generated images are sent: optionally re-encoded (png, jpeg or webp), capped in size,
+# and copied to a debug directory instead of being opened in a viewer on the server
+image_format = os.getenv('IMAGE_FORMAT') or None
+image_max_bytes = int(os.getenv('IMAGE_MAX_MB', '8')) * 1024 * 1024
+image_debug_dir = os.getenv('IMAGE_DEBUG_DIR') or None
+
+# Stream Gemini replies into a message that is edited as text arrives, instead of waiting for the whole answer
+stream_replies = os.getenv('STREAM_REPLIES', 'false').lower() == 'true'
+stream_edit_interval = float(os.getenv('STREAM_EDIT_INTERVAL', '1.0'))
+
+# Share one Gemini call between identical prompts; RESPONSE_CACHE_TTL > 0 also caches image answers
+coalescer = coalesce.Coalescer(
+    cache_entries=int(os.getenv('RESPONSE_CACHE_SIZE', '256')),
+    cache_ttl=int(os.getenv('RESPONSE_CACHE_TTL', '0')),
+)
+
+# Download image attachments with a size cap and shrink them in worker threads before sending them to Gemini
+attachment_loader = AttachmentLoader(
+    max_bytes=int(os.getenv('ATTACHMENT_MAX_MB', '10')) * 1024 * 1024,
+    max_side=int(os.getenv('ATTACHMENT_MAX_SIDE', '1536')),
+    workers=int(os.getenv('ATTACHMENT_WORKERS', '2')),
+    cache_bytes=int(os.getenv('ATTACHMENT_CACHE_MB', '64')) * 1024 * 1024,
+    retry=lambda func: retry_with_backoff(func, max_retries=3, initial_delay=1, max_delay=10,
+                                          operation_name="Image download", upstream="discord-cdn"),
+)
+
+# Queue outgoing messages per channel and send them within Discord's rate limits
+outbox = Outbox(
+    channel_rate=float(os.getenv('SEND_RATE_PER_CHANNEL', '1')),
+    channel_burst=int(os.getenv('SEND_BURST_PER_CHANNEL', '5')),
+)
+
+genai_import = None
+
+async def import_genai():
+    """Import google-genai in a worker thread; its import takes about half a second, which would stall heartbeats"""
+    global genai_import
+    if genai_import is None:     # one shared import, so nothing touches the module while it is half loaded
+        genai_import = asyncio.ensure_future(asyncio.to_thread(importlib.import_module, "google.genai"))
+    await asyncio.shield(genai_import)
+
+# Chances of the random replies
+baseball_chance = 0.05      # specify a probability for sending "Baseball, huh?"
+gif_chance = 0.05           # specify a probability for sending a random GIF
+niceties_chance = 0.03      # specify a probability for sending "now that the niceties are out of the way, let's get to business"
+
+# Route each message to its handlers with one compiled prefix/mention matcher
+router = Router(commands.prefixes)
+
 # Initiate a Discord client
 intents = discord.Intents.default()  # get an instance of Intents
 intents.members = True  # set member Intents to True
 intents.message_content = True  # set message content Intents to True
-client = discord.Client(intents=intents)
-
-# Define the models that will be used
-chat_model_name = "gemini-2.0-flash"    # Model for keeping chat history
-image_model_name = "gemini-2.0-flash-exp-image-generation"  # Model for generating images
-
-# Initiate a Google client
-google_client = genai.Client(api_key=google_key)
 
-# Initiate a chat to keep history
-chat = google_client.chats.create(model=chat_model_name)
+# "slim" doesn't download every guild's member list at startup and keeps no member cache (members are fetched
+# when needed); "full" is discord.py's default of chunking every guild and caching every member
+member_cache = os.getenv('MEMBER_CACHE', 'slim')
+if member_cache == 'full':
+    client = discord.Client(intents=intents)
+else:
+    client = discord.Client(intents=intents, chunk_guilds_at_startup=False,
+                            member_cache_flags=discord.MemberCacheFlags.none())
+
+# Models in order of preference; when every key has used up its quota for one, calls fall back to the next
+chat_models = [model.strip() for model in os.getenv('GEMINI_CHAT_MODELS', 'gemini-2.0-flash').split(',')]
+image_models = [model.strip() for model in os.getenv('GEMINI_IMAGE_MODELS', 'gemini-2.0-flash-exp-image-generation').split(',')]
+
+# Spread Gemini calls over one or more API keys, tracking each key's per-model quota locally.
+# Clients are created on first use; GEMINI_BASE_URL points them at another server (e.g. stub_servers.py)
+gemini_keys = [key.strip() for key in os.getenv('GEMINI_KEYS', google_key or '').split(',') if key.strip()]
+gemini_pool = GeminiPool(
+    gemini_keys,
+    {"chat": chat_models, "image": image_models},
+    rpm=int(os.getenv('GEMINI_RPM', '15')),
+    tpm=int(os.getenv('GEMINI_TPM', '1000000')),
+    rpd=int(os.getenv('GEMINI_RPD', '0')),
+    base_url=os.getenv('GEMINI_BASE_URL'),
+)
+
+# Save chat history to SQLite so conversations survive restarts (CHAT_STORE_PATH= turns it off)
+chat_history_tokens = int(os.getenv('CHAT_HISTORY_TOKENS', '8000'))
+chat_store_path = os.getenv('CHAT_STORE_PATH', 'chat_history.db')
+chat_store = ConversationStore(
+    chat_store_path,
+    token_budget=chat_history_tokens,
+    retention=int(os.getenv('CHAT_STORE_RETENTION_DAYS', '30')) * 86400,
+) if chat_store_path else None
+
+# Keep a separate, size-capped chat history for each channel (or each user in a channel)
+chat_sessions = ChatSessionManager(
+    max_sessions=int(os.getenv('CHAT_MAX_SESSIONS', '500')),
+    idle_ttl=int(os.getenv('CHAT_SESSION_TTL', '3600')),
+    token_budget=chat_history_tokens,
+    per_user=os.getenv('CHAT_SESSION_MODE', 'channel') == 'user',
+    store=chat_store,
+)
+
+# Build Gemini prompts: persona in the system instruction, prefixes and mentions stripped, oversized prompts
+# truncated (or rejected with PROMPT_OVERFLOW=reject)
+prompt_builder = PromptBuilder(
+    commands.prefixes,
+    max_tokens=int(os.getenv('PROMPT_MAX_TOKENS', '2000')),
+    truncate=os.getenv('PROMPT_OVERFLOW', 'truncate') != 'reject',
+)
+
+# Limit how many Gemini requests can be in flight at once, in total and per guild
+scheduler = RequestScheduler(
+    global_limit=int(os.getenv('GEMINI_MAX_CONCURRENCY', '32')),
+    guild_limit=int(os.getenv('GEMINI_MAX_CONCURRENCY_PER_GUILD', '8')),
+)
+
+# Image and chat requests wait in separate bounded queues, so a burst of images can't hold up text replies
+image_queue = workqueue.WorkQueue(
+    "image",
+    workers=int(os.getenv('IMAGE_WORKERS', '2')),
+    max_size=int(os.getenv('IMAGE_QUEUE_SIZE', '20')),
+    max_per_user=int(os.getenv('QUEUE_MAX_PER_USER', '3')),
+    priority=int(os.getenv('IMAGE_PRIORITY', '1')),
+)
+chat_queue = workqueue.WorkQueue(
+    "chat",
+    workers=int(os.getenv('CHAT_WORKERS', '8')),
+    max_size=int(os.getenv('CHAT_QUEUE_SIZE', '100')),
+    max_per_user=int(os.getenv('QUEUE_MAX_PER_USER', '3')),
+    priority=int(os.getenv('CHAT_PRIORITY', '0')),
+)
+
+def collect_stats():
+    """Report the caches, queues and breakers as gauges on every metrics scrape"""
+    tenor_stats = tenor.stats()
+    for component, stats in (("tenor_searches", tenor_stats["searches"]), ("tenor_gifs", tenor_stats["gifs"]),
+                             ("coalescer", coalescer.stats()), ("outbox", outbox.stats()),
+                             ("scheduler", scheduler.stats()), ("image_queue", image_queue.stats()),
+                             ("chat_queue", chat_queue.stats()), ("prompts", prompt_builder.stats())):
+        for name, value in stats.items():
+            yield f"marcus_{component}_{name}", {}, value
+    for name, value in (chat_store.stats() if chat_store is not None else {}).items():
+        yield f"marcus_chat_store_{name}", {}, value
+    yield "marcus_retry_budget_tokens", {}, retry.retry_budget.tokens
+    for upstream, breaker in retry.breakers.items():
+        yield "marcus_circuit_open", {"upstream": upstream}, int(breaker.state != "closed")
+
+metrics.add_collector(collect_stats)
+metrics.add_collector(gemini_pool.samples)
+
+# Health from the gateway heartbeat, loop lag and upstream error rates; served at /healthz and /readyz
+health_monitor = health.HealthMonitor(
+    client,
+    max_latency=float(os.getenv('HEALTH_MAX_LATENCY', '5')),
+    max_loop_lag=float(os.getenv('HEALTH_MAX_LOOP_LAG', '0.5')),
+    max_error_rate=float(os.getenv('HEALTH_MAX_ERROR_RATE', '0.5')),
+)
+metrics.add_collector(health_monitor.samples)
+
+# Admin commands over a local Unix socket (ADMIN_SOCKET) and/or the terminal (ADMIN_STDIN=true)
+admin_socket = os.getenv('ADMIN_SOCKET') or None
+admin_stdin = os.getenv('ADMIN_STDIN', 'false').lower() == 'true'
+admin = console.AdminConsole()
+
+@admin.command("send", "send <channel id> <message>")
+async def admin_send(channel_id, *words):
+    """Send a message to any channel the bot can see"""
+    channel = client.get_channel(int(channel_id)) or await client.fetch_channel(int(channel_id))
+    sent = await outbox.send(channel, " ".join(words))
+    return f"sent to #{getattr(channel, 'name', channel_id)}" if sent else "could not send (see logs)"
+
+@admin.command("queues", "queues")
+async def admin_queues():
+    """Show how much work is waiting"""
+    return "\n".join(f"{name}: {stats}" for name, stats in (
+        ("outbox", outbox.stats()), ("scheduler", scheduler.stats()), ("coalescer", coalescer.stats()),
+        ("image queue", image_queue.stats()), ("chat queue", chat_queue.stats()),
+        ("chat sessions", len(chat_sessions.sessions)), ("retry", retry.stats()), ("gemini", gemini_pool.stats()),
+        ("prompts", prompt_builder.stats()),
+        ("chat store", chat_store.stats() if chat_store is not None else "off"),
+    ))
+
+@admin.command("health", "health")
+async def admin_health():
+    """Show the live/ready/degraded states and the checks behind them"""
+    health_monitor.evaluate()
+    return json.dumps(health_monitor.snapshot(), indent=2)
+
+async def clear_chat_history():
+    chat_sessions.clear()
+    if chat_store is not None:
+        await chat_store.clear()
+
+@admin.command("flush", "flush tenor|responses|attachments|spelling|sessions|all")
+async def admin_flush(*names):
+    """Empty caches (and optionally chat histories)"""
+    caches = {
+        "tenor": tenor.clear,
+        "responses": coalescer.clear,
+        "attachments": attachment_loader.cache.clear,
+        "spelling": spelling.clear_cache,
+        "sessions": clear_chat_history,
+    }
+    # "all" keeps chat histories; flush them by name
+    selected = [name for name in caches if name != "sessions"] if names == ("all",) else list(names)
+    unknown = [name for name in selected if name not in caches]
+    if not selected or unknown:
+        return f"usage: flush {'|'.join(caches)}|all"
+    for name in selected:
+        result = caches[name]()
+        if asyncio.iscoroutine(result):
+            await result
+    return "flushed " + ", ".join(selected)
+
+async def get_member(guild, user_id):
+    """Return a guild member from the cache, or fetch it from Discord (the slim profile caches none up front)"""
+    return guild.get_member(user_id) or await guild.fetch_member(user_id)
+
+@admin.command("guilds", "guilds")
+async def admin_guilds():
+    """Show member and channel counts for each guild"""
+    return "\n".join(f"{guild.name} ({guild.id}): {guild.member_count} members, {len(guild.members)} cached, "
+                     f"{len(guild.channels)} channels" for guild in client.guilds) or "no guilds"
+
+@admin.command("member", "member <guild id> <user id>")
+async def admin_member(guild_id, user_id):
+    """Look up one member, fetching it from Discord when it isn't cached"""
+    guild = client.get_guild(int(guild_id))
+    if guild is None:
+        return f"unknown guild {guild_id}"
+    member = await get_member(guild, int(user_id))
+    return f"{member.name} ({member.display_name}), joined {member.joined_at:%Y-%m-%d}, " \
+           f"roles: {', '.join(role.name for role in member.roles[1:]) or 'none'}"
 
 # Output information about the bot joining the server
 
@@ -69,7 +322,7 @@ chat = google_client.chats.create(model=chat_model_name)
 async def on_member_join(member):
     """Send the user a DM upon joining the server"""
     await member.create_dm()
-    await do_try(member.dm_channel.send(f'Hi {member.name}, welcome to Project Lucid.'))
+    outbox.send(member.dm_channel, f'Hi {member.name}, welcome to Project Lucid.')
 
 @client.event
 async def on_message(message):
@@ -79,380 +332,286 @@ async def on_message(message):
     if message.author == client.user:   # if the message is by the bot, escape the function
         return
 
-    baseball_chance = 0.05      # specify a probability for sending "Baseball, huh?"
-    gif_chance = 0.05           # specify a probability for sending a random GIF
-    niceties_chance = 0.03      # specify a probability for sending "now that the niceties are out of the way, let's get to business"
-
-    # Randomly output "Baseball, huh?"
-    if commands.random_chance(baseball_chance):
-        await do_try(message.channel.send("Baseball, huh?"))
-
-    # Randomly send a GIF
-    if commands.random_chance(gif_chance):
-        await get_gif(message)
-
-    # Send a message from terminal
-    if message.content == '!!@@':
-        await send_from_console()
-
-    ## Brooklyn 99 response
-    if message.content == '99!':
-        brooklyn_99_quotes = [
-            'Sergeant, are you familiar with the Hungarian fencing move, Hossz Gorcs?',
-            'Bingpot!',
-            'Cool. Cool cool cool cool cool cool, no doubt no doubt no doubt no doubt.'
-            'Well, here are the orchids that I can name: Baclardia, Belagladis, Bentamia, Bephyllax, Depotium, Evotella.',
-            'VIN-DI-CATION!'
-        ]
-        response = random.choice(brooklyn_99_quotes)
-        await do_try(message.channel.send(response))
-
-    ## Google Gemini Response
-    prefixes = ["M!", "m!", "!M", "!m", "m?", "M?"]   # MarcusBot prefixes
-    if any([prefix in message.content for prefix in prefixes]) or \
-            client.user.mentioned_in(message) or \
-            (not message.mention_everyone and hasattr(message, "referenced_message")):
-
-        # Strip the message text of user id
-        if client.user.mentioned_in(message):
-            message.content = message.content.replace(f'<@{client.user.id}>',"")
-
-        # Correct any spelling errors before getting a response, which is necessary to trigger the correct model
+    # Most messages match no handler and return here without any NLP or API work
+    handlers = router.route(message, client.user)
+    if not handlers:
+        return
+    logs.request_id.set(str(message.id))    # ties together every log line caused by this message
+    for handler in handlers:
+        with metrics.stage(handler.__name__):
+            await handler(message)
+
+@router.random(baseball_chance)
+async def send_baseball(message):
+    """Randomly output 'Baseball, huh?'"""
+    outbox.send(message.channel, "Baseball, huh?")
+
+@router.random(gif_chance)
+async def send_random_gif(message):
+    """Randomly send a GIF"""
+    if health_monitor.degraded:     # skip the extras while the bot or its upstreams are struggling
+        return
+    await get_gif(message)
+
+@router.command('99!')
+async def send_brooklyn_99_quote(message):
+    """Brooklyn 99 response"""
+    outbox.send(message.channel, commands.brooklyn_99_quote())
+
+@router.addressed
+async def respond_with_gemini(message):
+    """Google Gemini Response"""
+
+    # Strip the message text of user id
+    message.content = message.content.replace(f'<@{client.user.id}>', "").replace(f'<@!{client.user.id}>', "")
+
+    # Correct any spelling errors before getting a response, which is necessary to trigger the correct model
+    with metrics.stage("correct_token"):
         token_list = await correct_token(message)
-        image_token_words = ["image",
-                             "picture",
-                             "photo",
-                             "cartoon",
-                             "sketch",
-                             "drawing",
-                             "painting",
-                             "photograph",
-                             "illustration"]
-
-        niceties_token_words = ["hi",
-                                "hello",
-                                "hey",
-                                "sup",
-                                "what's up",
-                                "how are you?"]
-
-        if len(message.attachments) != 0:
-            image_url = message.attachments[0].url # Get image url
-            
-            # Download image with retry logic
-            async def download_image():
-                response = requests.get(image_url, timeout=30)
-                if response.status_code == 200:
-                    return Image.open(BytesIO(response.content))
+
+    guild_id = message.guild.id if message.guild else None
+
+    # Usually already done in on_ready; later `from google.genai import ...` lines then cost nothing
+    await import_genai()
+
+    # Images attached to the message, or to the message it replies to (cached, so replies don't download again)
+    message_attachments = list(message.attachments)
+    if message.reference is not None and isinstance(message.reference.resolved, discord.Message):
+        message_attachments += message.reference.resolved.attachments
+    input_images = []
+    if message_attachments:
+        with metrics.stage("attachments"):
+            input_images = await attachment_loader.load_all(message_attachments)
+
+    # The persona goes in the system instruction, so the user turn is only what was asked, within the token limit
+    try:
+        prompt = prompt_builder.user_text(message, client.user)
+    except PromptTooLongError as e:
+        outbox.send(message.channel, f"That's too long for me, try something under {e.max_tokens * 4} characters.")
+        return
+
+    # Identical prompts share one Gemini call (and, for images, a short-lived cached answer)
+    prompt_key = coalesce.normalize_prompt(message.content, commands.prefixes)
+
+    if any([token_word in token_list for token_word in commands.image_token_words]):
+        from google.genai import types
+        input_parts = [types.Part.from_bytes(data=data, mime_type="image/jpeg") for data in input_images]
+
+        # Generate content with retry logic
+        async def generate_image_content(google_client, model):
+            return await google_client.aio.models.generate_content(
+                model=model,
+                contents=[prompt_builder.user_turn("image", prompt)] + input_parts,
+                config=prompt_builder.config("image"),
+            )
+
+        async def stream_image_content(google_client, model):
+            stream = await google_client.aio.models.generate_content_stream(
+                model=model,
+                contents=[prompt_builder.user_turn("image", prompt)] + input_parts,
+                config=prompt_builder.config("image"),
+            )
+            return await stream_to_channel(message, stream)
+
+        try:
+            with metrics.stage("gemini_image"):
+                def generate(func):
+                    tokens = (estimate_tokens(prompt) + prompt_builder.system_tokens("image")
+                              + 258 * len(input_parts))     # Gemini counts 258 tokens per image
+                    return run_queued(image_queue, message, lambda: retry_with_backoff(
+                        lambda: scheduler.run(guild_id, lambda: gemini_pool.run("image", func, tokens),
+                                              priority=image_queue.priority),
+                        operation_name="Gemini image generation", upstream="gemini-image"))
+
+                if stream_replies:
+                    response = await generate(stream_image_content)
                 else:
-                    raise requests.exceptions.HTTPError(f"HTTP {response.status_code}")
-            
-            try:
-                input_img = await retry_with_backoff(download_image, max_retries=3, initial_delay=5, max_delay=30, operation_name="Image download")
-            except Exception:
-                input_img = ""
-        else:
-            input_img = ""
-
-        if any([token_word in token_list for token_word in image_token_words]):
-            image_instruction = "Speak like you are texting the user. "
-            model_name = image_model_name
-            randomness = 0.9        # between 0.1 and 2.0; select the temperature of the model output
-            
-            # Generate content with retry logic
-            async def generate_image_content():
-                return google_client.models.generate_content(
-                    model=model_name,
-                    contents=[image_instruction + message.content, input_img],
-                    config=types.GenerateContentConfig(
-                        response_modalities=['Text', 'Image'],
-                        temperature=randomness,
+                    response = await coalescer.run(
+                        ("image", prompt_key, tuple(hash(data) for data in input_images)),
+                        lambda: generate(generate_image_content),
+                        cache=True,
                     )
-                )
-            
-            try:
-                response = await retry_with_backoff(generate_image_content, operation_name="Gemini image generation")
-            except Exception:
-                await message.channel.send("Sorry, I'm having trouble generating content right now. Please try again later.")
-                return
-        else:
-            chat_instruction = (
-                "Use at most 2000 characters. "
-                "You're very cool-headed. "
-                "Speak like you are texting the user. "
-            )
-            
-            # Send chat message with retry logic
-            async def send_chat_message():
-                return chat.send_message(chat_instruction + message.content)
-            
-            try:
-                response = await retry_with_backoff(send_chat_message, operation_name="Gemini chat")
-            except Exception:
-                await message.channel.send("Sorry, I'm having trouble responding right now. Please try again later.")
-                return
+        except workqueue.QueueFullError as e:
+            outbox.send(message.channel, busy_message(e))
+            return
+        except Exception:
+            outbox.send(message.channel, "Sorry, I'm having trouble generating content right now. Please try again later.")
+            return
+    else:
+        # Send chat message with retry logic
+        async def send_chat_message(google_client, model):
+            return await chat_sessions.send_message(message, google_client, model, prompt,
+                                                    config=prompt_builder.config("chat"))
 
-        # Parse the output response and send it
-        output_text = await parse_output(prefixes, message, response)
+        async def stream_chat_message(google_client, model):
+            return await stream_to_channel(message, chat_sessions.stream_message(
+                message, google_client, model, prompt, config=prompt_builder.config("chat")))
 
         try:
-            await do_try(message.channel.send(output_text))
-        except HTTPException:
-            print('Too many requests sent. Please try sending a message to the bot in 20-40 minutes.')
-
-        # Get the path to the image
-        cur_directory = os.getcwd()
-        image_name = 'generated-image.png'
-        path_to_image = os.path.join(cur_directory,image_name)
-
-        # Slice into the response to get the image data
-        for part in response.candidates[0].content.parts:
-            if part.text is not None:
-                print(part.text)
-            elif part.inline_data is not None:
-                try:
-                    ## Saves the image generated by Gemini
-                    image = Image.open(BytesIO(part.inline_data.data))
-                    image.save(path_to_image)
-                    image.show()
-
-                    ## Open the image as read and have the bot send it
-                    with open(path_to_image, 'rb') as f:
-                        picture = discord.File(f)
-                        await message.channel.send(file=picture)
-                    os.remove(path_to_image)
-                except FileNotFoundError:
-                    print(f"Error: Image file '{path_to_image}' not found.")
-                except Exception as e:
-                    print(f"An error occurred: {e}")
-            # if part.text is not None and part.inline_data is None:
-            #     gen_error_message = "There may have been an error in generating your image (err: 2). "
-            #     print(gen_error_message)
-            #     await message.channel.send(gen_error_message)
+            with metrics.stage("gemini_chat"):
+                def generate(func):
+                    tokens = (estimate_tokens(prompt) + prompt_builder.system_tokens("chat")
+                              + chat_sessions.get(message).history_tokens())
+                    return run_queued(chat_queue, message, lambda: retry_with_backoff(
+                        lambda: scheduler.run(guild_id, lambda: gemini_pool.run("chat", func, tokens),
+                                              priority=chat_queue.priority),
+                        operation_name="Gemini chat", upstream="gemini-chat"))
+
+                if stream_replies:
+                    response = await generate(stream_chat_message)
+                else:
+                    response = await coalescer.run(
+                        ("chat", chat_sessions.key_for(message), prompt_key),
+                        lambda: generate(send_chat_message),
+                    )
+        except workqueue.QueueFullError as e:
+            outbox.send(message.channel, busy_message(e))
+            return
+        except Exception:
+            outbox.send(message.channel, "Sorry, I'm having trouble responding right now. Please try again later.")
+            return
+
+    if not stream_replies:
+        # Parse the output response and send it
+        output_text = await parse_output(response)
+
+        # Queue the reply; the outbox splits it past 2000 characters and waits out rate limits
+        outbox.send(message.channel, output_text)
+
+    # Send the images generated by Gemini straight from the response bytes (after the text when streaming)
+    try:
+        with metrics.stage("images"):
+            pictures = await images.image_files(response, image_format=image_format,
+                                                max_bytes=image_max_bytes, debug_dir=image_debug_dir)
+        if pictures:
+            outbox.send(message.channel, files=pictures[:10])   # Discord allows 10 attachments per message
+    except Exception:
+        logger.exception("Could not send generated images")
 
 @client.event
 async def get_gif(message):
-    # Set the apikey and limit
-    lmt = 8   # limit how many GIFs are loaded at once
-    ckey = "marcus_bot_app"
-
     # Select a search term
-    tokens = word_tokenize(message.content)
-    parts_of_speech_list = pos_tag(tokens)
-    nouns = [word for word, parts_of_speech in parts_of_speech_list if parts_of_speech.startswith('NN')]
+    # (tagging runs in a thread since the first call loads the NLTK data)
+    with metrics.stage("gif_nouns"):
+        nouns = await asyncio.to_thread(nlp.nouns, message.content, offline_mode)
+    if not nouns:
+        return
     search_term = random.choice(nouns)
 
-    # Get the top 8 GIFs for the search term with retry logic
-    async def fetch_gifs():
-        r = requests.get(
-            "https://tenor.googleapis.com/v2/search?q=%s&key=%s&client_key=%s&limit=%s" \
-            % (search_term, tenor_key, ckey, lmt),
-            timeout=30
-        )
-        if r.status_code == 200:
-            return json.loads(r.content)
-        else:
-            raise requests.exceptions.HTTPError(f"Tenor API returned status {r.status_code}")
-    
+    # Search the term (cached) and send one of its top GIFs, reusing the downloaded bytes when we already have
+    # them. One lookup per reply, so each reply counts the term once for prefetching and the cache hit rates
+    image_name = 'tenor.gif'
     try:
-        top_8gifs = await retry_with_backoff(fetch_gifs, operation_name="Tenor API")
+        with metrics.stage("tenor_gif"):
+            gif = await retry_with_backoff(lambda: tenor.random_gif(search_term), operation_name="Tenor API",
+                                           upstream="tenor")
     except Exception:
-        print("Failed to fetch GIFs from Tenor API")
+        logger.warning("Failed to fetch a GIF from Tenor API", extra={"term": search_term})
+        outbox.send(message.channel, 'Could not download file.')
         return
 
-    if not top_8gifs or "results" not in top_8gifs or not top_8gifs["results"]:
-        print("No GIFs found from Tenor API")
+    if gif is None:
+        logger.info("No GIFs found from Tenor API", extra={"term": search_term})
         return
-        
-    result = top_8gifs["results"]
-    random_result = random.choice(result)
-    gif_url = random_result["media_formats"]["gif"]["url"]
+    _, gif_bytes = gif
+    image_file = discord.File(io.BytesIO(gif_bytes), image_name)
+    outbox.send(message.channel, files=[image_file])
 
-    # Send the GIF from the url
-    image_name = 'tenor.gif'
-    async with aiohttp.ClientSession() as session:
-        async with session.get(gif_url) as resp:
-            if resp.status != 200:
-                return await message.channel.send('Could not download file.')
-            image = io.BytesIO(await resp.read())
-            image_file = discord.File(image, image_name)
-            await message.channel.send(file=image_file)
-
-@client.event
-async def send_from_console():
-    marcus_bot_channel_id = 1354446865919377570
-    run = True
-    while run:
-        message = input('Enter message: ')
-        if "!!!" in message:
-            return
-        channel = client.get_channel(marcus_bot_channel_id)
-        await channel.send(message)
+speller_load = None
 
 async def correct_token(message):
-    spell = Speller()
-    corrected_tokens = []
-    words = message.content.split()
-    for word in words:
-        corrected_token = spell(word)
-        if corrected_token is not None:
-            corrected_tokens.append(corrected_token)
-        else:
-            corrected_tokens.append(word)
-    return corrected_tokens
-
-async def parse_output(key_phrases, message, response):
+    """Return the message's words with trigger words spell-corrected"""
+    global speller_load
+    if spell_mode != 'off':
+        # Both modes need the speller's dictionary; load it in a worker thread the first time
+        if speller_load is None:
+            speller_load = asyncio.ensure_future(asyncio.to_thread(spelling.get_speller))
+        await asyncio.shield(speller_load)
+    return spelling.correct_tokens(message.content, commands.trigger_words, mode=spell_mode)
+
+async def parse_output(response):
     """Parse the bot output response"""
-    output_text = ""
+    # Prefixes are stripped before sending, so the reply no longer echoes them back and needs no trimming
     error_message = "There may have been an error in generating your image (err: 1). "
-    for index, element in enumerate(key_phrases):
-        if element in message.content:
-            bot_prefix = key_phrases[index]
-            try:
-                stringIndex = response.text.find(bot_prefix)
-                if stringIndex != -1:
-                    output_text = response.text[:stringIndex]
-                else:
-                    output_text = response.text
-            except AttributeError:
-                print(error_message)
-                output_text = error_message
-    if len(output_text) == 0: # if the message was a reply and does not include the prefix
-        output_text = response.text
-    return output_text  # Send the text from the response
-
-# Centralized retry helper functions
-async def retry_with_backoff(func, max_retries=3, initial_delay=10, max_delay=60, operation_name="operation"):
-    """Generic retry function with exponential backoff for any async operation"""
-    for attempt in range(max_retries):
-        try:
-            return await func()
-        except (OSError, ConnectionError, TimeoutError, requests.exceptions.RequestException) as e:
-            if attempt < max_retries - 1:
-                retry_delay = min(initial_delay * (2 ** attempt), max_delay)
-                print(f"{operation_name} network error: {e}. Retrying in {retry_delay} seconds... (Attempt {attempt + 1}/{max_retries})")
-                await asyncio.sleep(retry_delay)
-            else:
-                print(f"{operation_name} failed after {max_retries} attempts: {e}")
-                raise
-        except Exception as e:
-            if attempt < max_retries - 1:
-                retry_delay = min(initial_delay * (2 ** attempt), max_delay)
-                print(f"{operation_name} error: {e}. Retrying in {retry_delay} seconds... (Attempt {attempt + 1}/{max_retries})")
-                await asyncio.sleep(retry_delay)
-            else:
-                print(f"{operation_name} failed after {max_retries} attempts: {e}")
-                raise
-
-def retry_sync_with_backoff(func, max_retries=3, initial_delay=10, max_delay=60, operation_name="operation"):
-    """Generic retry function with exponential backoff for synchronous operations"""
-    import time
-    for attempt in range(max_retries):
-        try:
-            return func()
-        except (OSError, ConnectionError, TimeoutError, requests.exceptions.RequestException) as e:
-            if attempt < max_retries - 1:
-                retry_delay = min(initial_delay * (2 ** attempt), max_delay)
-                print(f"{operation_name} network error: {e}. Retrying in {retry_delay} seconds... (Attempt {attempt + 1}/{max_retries})")
-                time.sleep(retry_delay)
-            else:
-                print(f"{operation_name} failed after {max_retries} attempts: {e}")
-                raise
-        except Exception as e:
-            if attempt < max_retries - 1:
-                retry_delay = min(initial_delay * (2 ** attempt), max_delay)
-                print(f"{operation_name} error: {e}. Retrying in {retry_delay} seconds... (Attempt {attempt + 1}/{max_retries})")
-                time.sleep(retry_delay)
-            else:
-                print(f"{operation_name} failed after {max_retries} attempts: {e}")
-                raise
-
-async def do_try(function, max_retries = 5):
-    """Enhanced Discord message sending with retry logic"""
-    for attempt in range(max_retries):
-        try:
-            return await function
-        except discord.errors.HTTPException as e:
-            if e.status == 429:
-                retry_after = 15*60   # retry reconnecting after 20 minutes
-                print(f"Rate limited. Retrying in {retry_after} seconds...")
-                await asyncio.sleep(retry_after)
-            else:
-                raise
-        except (OSError, ConnectionError, TimeoutError) as e:
-            if attempt < max_retries - 1:
-                retry_delay = min(30 * (2 ** attempt), 300)  # Exponential backoff
-                print(f"Network error: {e}. Retrying in {retry_delay} seconds... (Attempt {attempt + 1}/{max_retries})")
-                await asyncio.sleep(retry_delay)
-            else:
-                print(f"Network error after {max_retries} attempts: {e}")
-                raise
-        except Exception as e:
-            if attempt < max_retries - 1:
-                retry_delay = min(30 * (2 ** attempt), 300)
-                print(f"Unexpected error: {e}. Retrying in {retry_delay} seconds... (Attempt {attempt + 1}/{max_retries})")
-                await asyncio.sleep(retry_delay)
-            else:
-                print(f"Error after {max_retries} attempts: {e}")
-                raise
-    raise Exception("Max connection attempts reached. Please wait another 20 minutes.")
+    try:
+        return response.text or ""
+    except AttributeError:
+        logger.warning(error_message)
+        return error_message
+
+async def run_queued(work_queue, message, func):
+    """Run func on a work queue, telling the user their place in line if they have to wait"""
+    future, position = work_queue.submit(message.author.id, func)
+    if position:
+        outbox.send(message.channel, f"Queued, position {position}.")
+    return await future
+
+def busy_message(error):
+    """What to say when a work queue turns a request away"""
+    if error.per_user:
+        return "You already have a few requests waiting. Give me a moment to catch up."
+    return "I'm busy right now. Please try again in a minute."
+
+async def stream_to_channel(message, stream):
+    """Show a streamed response as it arrives. Returns the chunks."""
+    reply = streaming.StreamingReply(outbox, message.channel, edit_interval=stream_edit_interval)
+    return await streaming.stream_reply(stream, reply)
 
 # Network resilience and reconnection handling
 @client.event
 async def on_disconnect():
     """Handle bot disconnection gracefully"""
-    print(f"[{datetime.datetime.now()}] Bot disconnected from Discord")
-    print("Attempting to reconnect...")
+    logger.warning("Bot disconnected from Discord, attempting to reconnect")
 
 @client.event
 async def on_resumed():
     """Handle bot reconnection"""
-    print(f"[{datetime.datetime.now()}] Bot reconnected to Discord")
-    print(f"Resumed session with {len(client.guilds)} guilds")
+    logger.info("Bot reconnected to Discord", extra={"guilds": len(client.guilds)})
 
 @client.event
 async def on_error(event, *args, **kwargs):
     """Handle any errors that occur"""
-    print(f"[{datetime.datetime.now()}] Error in event {event}: {args} {kwargs}")
-
-# Network health monitoring
-async def network_health_check():
-    """Periodically check network connectivity"""
-    while True:
-        try:
-            # Test basic internet connectivity using a simple endpoint
-            response = requests.get("https://httpbin.org/status/200", timeout=10)
-            if response.status_code == 200:
-                print(f"[{datetime.datetime.now()}] Network health check: OK")
-            else:
-                print(f"[{datetime.datetime.now()}] Network health check: HTTP {response.status_code}")
-        except Exception as e:
-            print(f"[{datetime.datetime.now()}] Network health check failed: {e}")
-        
-        # Check every 5 minutes
-        await asyncio.sleep(300)
+    logger.exception("Error in event", extra={"event": event})
 
-# Start network monitoring when bot is ready
 @client.event
 async def on_ready():
     guild_name = os.getenv('DISCORD_GUILD')
     guild = discord.utils.get(client.guilds, name=guild_name)
-    print(f'{client.user} has connected to Discord!')  # Indicate that the bot has connected to the guild
-    print(f'{client.user} is connected to the following guilds:\n')
-    
+    # Open the shared HTTP connection pool (kept across reconnects)
+    await http_client.start(
+        limit=int(os.getenv('HTTP_MAX_CONNECTIONS', '100')),
+        limit_per_host=int(os.getenv('HTTP_MAX_PER_HOST', '10')),
+        timeout=int(os.getenv('HTTP_TIMEOUT', '30')),
+    )
+    # Load google-genai off the event loop before the first message needs it
+    await import_genai()
+
+    logger.info(f'{client.user} has connected to Discord!')  # Indicate that the bot has connected to the guild
+    global startup_reported
+    if not startup_reported:
+        startup_reported = True
+        logger.info("Startup finished", extra={
+            "startup_seconds": round(time.perf_counter() - startup_started, 3),
+            "import_seconds": round(imports_finished - startup_started, 3),
+        })
+
     if guild:
-        print(f'{guild.name} (id: {guild.id})')
-        print(f'There are {len(guild.members)} members')
-        members = '\n - '.join([member.name for member in guild.members])
-        print(f'Guild Members:\n - {members}')
+        logger.info("Connected to guild", extra={
+            "guild": guild.name,
+            "guild_id": guild.id,
+            "members": guild.member_count,
+            "cached_members": len(guild.members),
+            "channels": len(guild.channels),
+        })
     else:
-        print(f'Guild "{guild_name}" not found. Available guilds:')
-        for g in client.guilds:
-            print(f' - {g.name} (id: {g.id})')
+        # The admin console's "guilds" command lists them
+        logger.warning("Guild not found", extra={"guild": guild_name, "available_guilds": len(client.guilds)})
     
-    # Start network health monitoring
-    asyncio.create_task(network_health_check())
-    print("Network health monitoring started")
+    # Keep GIFs for the most popular search terms warm
+    global tenor_prefetch_task
+    if tenor_prefetch and tenor_prefetch_task is None:
+        tenor_prefetch_task = asyncio.create_task(tenor.prefetch_loop())
+        logger.info("Tenor prefetching started")
 
 # Enhanced error handling for network issues
 async def run_bot_with_retry():
@@ -462,75 +621,104 @@ async def run_bot_with_retry():
     
     for attempt in range(max_retries):
         try:
-            print(f"[{datetime.datetime.now()}] Attempt {attempt + 1}/{max_retries} to connect to Discord...")
+            logger.info("Connecting to Discord", extra={"attempt": attempt + 1, "max_retries": max_retries})
             await client.start(discord_key)
             break  # If we get here, connection was successful
             
         except discord.errors.ConnectionClosed as e:
-            print(f"[{datetime.datetime.now()}] Connection closed: {e}")
+            logger.warning("Connection closed", extra={"error": str(e)})
             if attempt < max_retries - 1:
-                print(f"Waiting {retry_delay} seconds before retry...")
+                logger.info("Waiting before reconnecting", extra={"delay": retry_delay})
                 await asyncio.sleep(retry_delay)
                 retry_delay = min(retry_delay * 2, 300)  # Exponential backoff, max 5 minutes
             else:
-                print("Max retry attempts reached. Exiting.")
+                logger.error("Max retry attempts reached. Exiting.")
                 raise
                 
         except discord.errors.HTTPException as e:
-            print(f"[{datetime.datetime.now()}] HTTP error: {e}")
+            logger.warning("HTTP error", extra={"error": str(e), "status": e.status})
             if e.status == 429:  # Rate limited
+                metrics.rate_limited.inc(upstream="discord")
                 retry_after = e.retry_after or 60
-                print(f"Rate limited. Waiting {retry_after} seconds...")
+                logger.warning("Rate limited, waiting before reconnecting", extra={"delay": retry_after})
                 await asyncio.sleep(retry_after)
             elif attempt < max_retries - 1:
-                print(f"Waiting {retry_delay} seconds before retry...")
+                logger.info("Waiting before reconnecting", extra={"delay": retry_delay})
                 await asyncio.sleep(retry_delay)
                 retry_delay = min(retry_delay * 2, 300)
             else:
-                print("Max retry attempts reached. Exiting.")
+                logger.error("Max retry attempts reached. Exiting.")
                 raise
                 
         except (OSError, ConnectionError, TimeoutError) as e:
-            print(f"[{datetime.datetime.now()}] Network error: {e}")
+            logger.warning("Network error", extra={"error": str(e)})
             if attempt < max_retries - 1:
-                print(f"Network issue detected. Waiting {retry_delay} seconds before retry...")
+                logger.info("Waiting before reconnecting", extra={"delay": retry_delay})
                 await asyncio.sleep(retry_delay)
                 retry_delay = min(retry_delay * 2, 300)
             else:
-                print("Max retry attempts reached. Exiting.")
+                logger.error("Max retry attempts reached. Exiting.")
                 raise
                 
         except Exception as e:
-            print(f"[{datetime.datetime.now()}] Unexpected error: {e}")
+            logger.exception("Unexpected error")
             if attempt < max_retries - 1:
-                print(f"Unexpected error. Waiting {retry_delay} seconds before retry...")
+                logger.info("Waiting before reconnecting", extra={"delay": retry_delay})
                 await asyncio.sleep(retry_delay)
                 retry_delay = min(retry_delay * 2, 300)
             else:
-                print("Max retry attempts reached. Exiting.")
+                logger.error("Max retry attempts reached. Exiting.")
                 raise
 
+async def run_bot():
+    """Run the bot and release shared resources once it stops"""
+    # Background monitors that live as long as the process, independent of the Discord connection
+    loop_lag_task = asyncio.create_task(metrics.monitor_loop_lag())
+    health_task = asyncio.create_task(health_monitor.run())
+    store_task = asyncio.create_task(chat_store.run()) if chat_store is not None else None
+    metrics_runner = None
+    if metrics_port:
+        metrics_runner = await metrics.start_server(metrics_port, metrics_host, routes=health_monitor.routes())
+    if admin_socket:
+        await admin.serve_socket(admin_socket)
+    if admin_stdin:
+        admin.read_stdin(asyncio.get_running_loop())
+    try:
+        await run_bot_with_retry()
+    finally:
+        loop_lag_task.cancel()
+        health_task.cancel()
+        await image_queue.close()
+        await chat_queue.close()
+        if store_task is not None:
+            store_task.cancel()
+            await chat_store.close()     # writes the turns still queued
+        await admin.close()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        await outbox.close()
+        await http_client.close()
+        attachment_loader.shutdown()
+
 # Start the bot
 if __name__ == "__main__":
     try:
-        print("Starting MarcusBot...")
-        print(f"Discord Key: {'Set' if discord_key else 'Not Set'}")
-        print(f"Gemini Key: {'Set' if google_key else 'Not Set'}")
-        print(f"Tenor Key: {'Set' if tenor_key else 'Not Set'}")
-        print(f"Guild: {'Set' if os.getenv('DISCORD_GUILD') else 'Not Set'}")
-        
+        logger.info("Starting MarcusBot...", extra={
+            "discord_key": 'Set' if discord_key else 'Not Set',
+            "gemini_keys": len(gemini_keys),
+            "tenor_key": 'Set' if tenor_key else 'Not Set',
+            "guild": 'Set' if os.getenv('DISCORD_GUILD') else 'Not Set',
+        })
+
         if not discord_key:
-            print("Error: DISCORD_KEY not found in environment variables")
+            logger.error("Error: DISCORD_KEY not found in environment variables")
             exit(1)
-        
-        # Import datetime for timestamps
-        import datetime
-        
+
         # Run the bot with enhanced error handling
-        asyncio.run(run_bot_with_retry())
+        asyncio.run(run_bot())
         
     except KeyboardInterrupt:
-        print("\nBot stopped by user")
-    except Exception as e:
-        print(f"Fatal error: {e}")
+        logger.info("Bot stopped by user")
+    except Exception:
+        logger.exception("Fatal error")
         exit(1)
\ No newline at end of file
@@ -0,0 +1,104 @@
+# caches.py
+# Small in-memory caches with hit/miss counters
+
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """Least-recently-used cache with a cap on entries, where each entry expires after a TTL"""
+
+    def __init__(self, max_entries=256, ttl=3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()   # key -> (expiry time, value), least recently used first
+
+    def get(self, key, default=None):
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return default
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key, value, ttl=None):
+        self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def expires_in(self, key):
+        """Seconds until an entry expires (0 if it is missing or already expired)"""
+        entry = self._entries.get(key)
+        return max(0.0, entry[0] - time.monotonic()) if entry else 0.0
+
+    def pop(self, key, default=None):
+        entry = self._entries.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def clear(self):
+        self._entries.clear()
+
+    def __contains__(self, key):
+        return self.expires_in(key) > 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+
+class ByteLRUCache:
+    """Least-recently-used cache of byte payloads capped by their total size"""
+
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()   # key -> bytes, least recently used first
+
+    def get(self, key, default=None):
+        data = self._entries.get(key)
+        if data is None:
+            self.misses += 1
+            return default
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return data
+
+    def set(self, key, data):
+        if len(data) > self.max_bytes:    # never let one payload flush the whole cache
+            return
+        self.pop(key)
+        self._entries[key] = data
+        self.size += len(data)
+        while self.size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= len(evicted)
+
+    def pop(self, key, default=None):
+        data = self._entries.pop(key, None)
+        if data is None:
+            return default
+        self.size -= len(data)
+        return data
+
+    def clear(self):
+        self._entries.clear()
+        self.size = 0
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries), "bytes": self.size}
@@ -0,0 +1,75 @@
+# coalesce.py
+# Shares one upstream call between identical requests, with an optional short-lived response cache
+
+import asyncio
+import re
+from functools import lru_cache
+from caches import TTLCache
+
+_nickname_mention_pattern = re.compile(r"<@!(\d+)>")
+
+
+@lru_cache(maxsize=8)
+def _prefix_pattern(prefixes):
+    # Only a prefix standing on its own counts, so "Sam?" and "Sa" stay different prompts
+    alternatives = "|".join(re.escape(prefix) for prefix in sorted(prefixes, key=len, reverse=True))
+    return re.compile(r"(?<!\S)(?:" + alternatives + r")(?!\S)")
+
+
+def normalize_prompt(text, prefixes):
+    """Reduce a prompt to what matters for matching duplicates: no prefixes, case or extra spaces.
+    Mentions are kept (in one form), since "a picture of @Alice" and "a picture of @Bob" are different prompts."""
+    text = _prefix_pattern(tuple(prefixes)).sub(" ", text)
+    text = _nickname_mention_pattern.sub(r"<@\1>", text)
+    return " ".join(text.split()).lower()
+
+
+class Coalescer:
+    """Runs each distinct request once; identical requests made while it runs wait for the same result"""
+
+    def __init__(self, cache_entries=256, cache_ttl=0):
+        self.cache_ttl = cache_ttl      # 0 turns the response cache off
+        self.cache = TTLCache(max_entries=cache_entries, ttl=cache_ttl or 1)
+        self.in_flight = {}             # key -> task running the upstream call
+        self.calls = 0
+        self.coalesced = 0
+        self.cache_hits = 0
+
+    async def run(self, key, func, cache=False):
+        """Await func() for this key, sharing an in-flight call or a cached result when there is one.
+        Only set cache=True for requests whose answer doesn't depend on chat history."""
+        self.calls += 1
+        if cache and self.cache_ttl:
+            cached = self.cache.get(key)
+            if cached is not None:
+                self.cache_hits += 1
+                return cached
+
+        task = self.in_flight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            # Run the call in its own task so one caller being cancelled doesn't cancel it for the others
+            task = self.in_flight[key] = asyncio.ensure_future(func())
+            task.add_done_callback(lambda finished: self._finished(key, finished, cache))
+        return await asyncio.shield(task)
+
+    def _finished(self, key, task, cache):
+        if self.in_flight.get(key) is task:
+            del self.in_flight[key]
+        if task.cancelled():
+            return
+        if task.exception() is None and cache and self.cache_ttl:
+            self.cache.set(key, task.result(), ttl=self.cache_ttl)
+
+    def stats(self):
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "cache_hits": self.cache_hits,
+            "in_flight": len(self.in_flight),
+            "cached": len(self.cache),
+        }
+
+    def clear(self):
+        self.cache.clear()
@@ -1,9 +1,44 @@
 import random
 
+# MarcusBot prefixes
+prefixes = ["M!", "m!", "!M", "!m", "m?", "M?"]
+
+# Words that make the bot use the image model
+image_token_words = ["image",
+                     "picture",
+                     "photo",
+                     "cartoon",
+                     "sketch",
+                     "drawing",
+                     "painting",
+                     "photograph",
+                     "illustration"]
+
+# Greetings
+niceties_token_words = ["hi",
+                        "hello",
+                        "hey",
+                        "sup",
+                        "what's up",
+                        "how are you?"]
+
+# Every word spell correction looks out for
+trigger_words = frozenset(image_token_words + niceties_token_words)
+
 def random_chance(chance):
     threshold = 1 - chance
     probability = random.random()
     if probability >= threshold:
         return True
     else:
-        return False
\ No newline at end of file
+        return False
+
+def brooklyn_99_quote():
+    brooklyn_99_quotes = [
+        'Sergeant, are you familiar with the Hungarian fencing move, Hossz Gorcs?',
+        'Bingpot!',
+        'Cool. Cool cool cool cool cool cool, no doubt no doubt no doubt no doubt.',
+        'Well, here are the orchids that I can name: Baclardia, Belagladis, Bentamia, Bephyllax, Depotium, Evotella.',
+        'VIN-DI-CATION!'
+    ]
+    return random.choice(brooklyn_99_quotes)
@@ -0,0 +1,124 @@
+# console.py
+# Admin commands over a local Unix socket or the terminal, run inside the bot's event loop without blocking it
+#
+# Usage (while the bot runs with ADMIN_SOCKET set):
+#   python3 console.py [--socket marcus-admin.sock] [command ...]
+# With no command it reads commands interactively, e.g. `send 1354446865919377570 hello`, `queues`, `flush all`.
+
+import argparse
+import asyncio
+import inspect
+import logging
+import os
+import sys
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class AdminConsole:
+    """Registry of admin commands; each takes the command's arguments and returns the text to reply with"""
+
+    def __init__(self, timeout=30):
+        self.timeout = timeout      # seconds a socket client gets to send its command, and a command gets to run
+        self.commands = {}          # name -> (handler, usage)
+        self._server = None
+        self._path = None
+        self.command("help", "help")(self._help)
+
+    def command(self, name, usage):
+        """Register an async handler(*args) for a command"""
+        def decorator(handler):
+            self.commands[name] = (handler, usage)
+            return handler
+        return decorator
+
+    async def execute(self, line):
+        """Run one command line and return its output"""
+        words = line.split()
+        if not words:
+            return ""
+        entry = self.commands.get(words[0])
+        if entry is None:
+            return f"unknown command {words[0]!r}; try help"
+        handler, usage = entry
+        try:
+            inspect.signature(handler).bind(*words[1:])
+        except TypeError:
+            return f"usage: {usage}"
+        try:
+            return await asyncio.wait_for(handler(*words[1:]), self.timeout)
+        except Exception as e:
+            logger.exception("Admin command failed", extra={"command": words[0]})
+            return f"error: {e}"
+
+    async def _help(self):
+        return "\n".join(usage for _, usage in self.commands.values())
+
+    async def serve_socket(self, path):
+        """Accept one command per connection on a Unix socket that only this user can open"""
+        if os.path.exists(path):
+            os.unlink(path)     # left behind by a previous run
+        self._server = await asyncio.start_unix_server(self._handle, path=path)
+        self._path = path
+        os.chmod(path, 0o600)
+        logger.info("Admin socket listening", extra={"path": path})
+
+    async def _handle(self, reader, writer):
+        try:
+            line = await asyncio.wait_for(reader.readline(), self.timeout)
+            output = await self.execute(line.decode(errors="replace"))
+            writer.write(output.encode() + b"\n")
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def read_stdin(self, loop):
+        """Read commands typed at the terminal on a daemon thread, running each one on the loop"""
+        def read():
+            for line in sys.stdin:
+                output = asyncio.run_coroutine_threadsafe(self.execute(line), loop).result()
+                if output:
+                    print(output, flush=True)
+        threading.Thread(target=read, name="admin-stdin", daemon=True).start()
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+            if os.path.exists(self._path):
+                os.unlink(self._path)
+
+
+async def send_command(path, line):
+    reader, writer = await asyncio.open_unix_connection(path)
+    writer.write(line.encode() + b"\n")
+    await writer.drain()
+    output = await reader.read()
+    writer.close()
+    return output.decode().rstrip("\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Send admin commands to a running MarcusBot")
+    parser.add_argument("--socket", default=os.getenv("ADMIN_SOCKET", "marcus-admin.sock"))
+    parser.add_argument("command", nargs=argparse.REMAINDER)
+    args = parser.parse_args()
+    if args.command:
+        print(asyncio.run(send_command(args.socket, " ".join(args.command))))
+        return
+    while True:
+        try:
+            line = input("marcus> ")
+        except (EOFError, KeyboardInterrupt):
+            print()
+            return
+        if line.strip():
+            print(asyncio.run(send_command(args.socket, line)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+# gemini_pool.py
+# Spreads Gemini calls over several API keys and falls back to other models as quotas run out
+
+import logging
+import time
+from collections import deque
+import metrics
+import retry
+
+logger = logging.getLogger(__name__)
+
+
+class SlidingWindow:
+    """Sum of amounts recorded over the last `window` seconds"""
+
+    def __init__(self, window):
+        self.window = window
+        self.events = deque()   # (time, amount)
+        self.total = 0
+
+    def add(self, amount=1):
+        self.events.append((time.monotonic(), amount))
+        self.total += amount
+
+    def current(self):
+        cutoff = time.monotonic() - self.window
+        while self.events and self.events[0][0] <= cutoff:
+            self.total -= self.events.popleft()[1]
+        return self.total
+
+    def frees_in(self, amount):
+        """Seconds until at least `amount` has left the window"""
+        freed = 0
+        for at, value in self.events:
+            freed += value
+            if freed >= amount:
+                return max(0.0, at + self.window - time.monotonic())
+        return 0.0
+
+
+class Quota:
+    """Local view of one key's quota for one model: requests and tokens per minute, requests per day"""
+
+    def __init__(self, rpm, tpm, rpd):
+        self.rpm, self.tpm, self.rpd = rpm, tpm, rpd
+        self.minute_requests = SlidingWindow(60)
+        self.minute_tokens = SlidingWindow(60)
+        self.day_requests = SlidingWindow(86400)
+        self.blocked_until = 0.0    # set when Gemini answers 429 despite our counts
+
+    def headroom(self, tokens):
+        """Share of this minute's quota left after a call of `tokens` tokens (below 0 means it doesn't fit)"""
+        if time.monotonic() < self.blocked_until:
+            return -1.0
+        if self.rpd and self.day_requests.current() >= self.rpd:
+            return -1.0
+        requests_left = (self.rpm - self.minute_requests.current() - 1) / self.rpm if self.rpm else 1.0
+        tokens_left = (self.tpm - self.minute_tokens.current() - tokens) / self.tpm if self.tpm else 1.0
+        return min(requests_left, tokens_left)
+
+    def wait_time(self, tokens):
+        """Seconds until a call of `tokens` tokens would fit"""
+        waits = [self.blocked_until - time.monotonic()]
+        if self.rpm and self.minute_requests.current() >= self.rpm:
+            waits.append(self.minute_requests.frees_in(self.minute_requests.current() - self.rpm + 1))
+        if self.tpm and self.minute_tokens.current() + tokens > self.tpm:
+            waits.append(self.minute_tokens.frees_in(self.minute_tokens.current() + tokens - self.tpm))
+        if self.rpd and self.day_requests.current() >= self.rpd:
+            waits.append(self.day_requests.frees_in(1))
+        return max(0.0, *waits)
+
+    def reserve(self, tokens):
+        self.minute_requests.add()
+        self.day_requests.add()
+        self.minute_tokens.add(tokens)
+
+
+class GeminiKey:
+    def __init__(self, api_key, base_url=None):
+        self.api_key = api_key
+        self.name = "…" + api_key[-4:]      # safe to log
+        self.base_url = base_url
+        self.quotas = {}                    # model -> Quota
+        self._client = None
+
+    @property
+    def client(self):
+        """The google-genai client for this key, created on first use"""
+        if self._client is None:
+            from google import genai
+            http_options = {"base_url": self.base_url} if self.base_url else None
+            self._client = genai.Client(api_key=self.api_key, http_options=http_options)
+        return self._client
+
+
+class GeminiPool:
+    """Routes each call to the key with the most quota left for the first model in a fallback list that has room.
+
+    `models` maps a kind of call ("chat", "image") to its models in order of preference."""
+
+    def __init__(self, api_keys, models, rpm=15, tpm=1_000_000, rpd=0, base_url=None):
+        self.keys = [GeminiKey(api_key, base_url) for api_key in api_keys]
+        self.models = models
+        self.limits = (rpm, tpm, rpd)
+        self.calls = 0
+        self.fallbacks = 0
+        self.quota_errors = 0
+
+    def _quota(self, key, model):
+        quota = key.quotas.get(model)
+        if quota is None:
+            quota = key.quotas[model] = Quota(*self.limits)
+        return quota
+
+    def pick(self, kind, tokens=0, exclude=()):
+        """Return (key, model) with room for the call, preferring earlier models, or None"""
+        for model in self.models[kind]:
+            best, best_headroom = None, 0.0
+            for key in self.keys:
+                if (key, model) in exclude:
+                    continue
+                headroom = self._quota(key, model).headroom(tokens)
+                if headroom >= 0 and (best is None or headroom > best_headroom):
+                    best, best_headroom = key, headroom
+            if best is not None:
+                return best, model
+        return None
+
+    def wait_time(self, kind, tokens=0):
+        """Seconds until any key has room for the call on any of the kind's models"""
+        return min(self._quota(key, model).wait_time(tokens) for model in self.models[kind] for key in self.keys)
+
+    async def run(self, kind, func, tokens=0):
+        """Await func(client, model) using the key and model with the most headroom.
+
+        A 429 from Gemini parks that key/model and the call moves straight on to the next candidate. When
+        nothing has room, raises retry.RetryLater with the time until something frees up."""
+        if not self.keys:
+            raise ValueError("No Gemini API keys configured (set GEMINI_KEY or GEMINI_KEYS)")
+        self.calls += 1
+        tried = set()
+        while True:
+            choice = self.pick(kind, tokens, exclude=tried)
+            if choice is None:
+                raise retry.RetryLater(f"Gemini {kind} quota used up on every key and model",
+                                       retry_after=self.wait_time(kind, tokens) or 1.0)
+            key, model = choice
+            quota = self._quota(key, model)
+            quota.reserve(tokens)
+            try:
+                response = await func(key.client, model)
+            except Exception as e:
+                if getattr(e, "code", None) != 429:
+                    raise
+                self.quota_errors += 1
+                metrics.rate_limited.inc(upstream=f"gemini-{kind}")    # retry_with_backoff never sees this 429
+                _, retry_after = retry.classify(e)
+                quota.blocked_until = time.monotonic() + (retry_after or 60)
+                logger.warning("Gemini quota exhausted, trying the next key or model",
+                               extra={"key": key.name, "model": model, "retry_after": retry_after})
+                tried.add(choice)
+                continue
+            used = usage_tokens(response)
+            if used > tokens:
+                quota.minute_tokens.add(used - tokens)
+            if model != self.models[kind][0]:
+                self.fallbacks += 1
+            return response
+
+    def stats(self):
+        return {
+            "calls": self.calls,
+            "fallbacks": self.fallbacks,
+            "quota_errors": self.quota_errors,
+            "keys": {key.name: {model: {"rpm": quota.minute_requests.current(), "tpm": quota.minute_tokens.current()}
+                                for model, quota in key.quotas.items()} for key in self.keys},
+        }
+
+    def samples(self):
+        """Per key and model request and token rates for the metrics endpoint"""
+        yield "marcus_gemini_calls", {}, self.calls
+        yield "marcus_gemini_fallbacks", {}, self.fallbacks
+        yield "marcus_gemini_quota_errors", {}, self.quota_errors
+        for key in self.keys:
+            for model, quota in key.quotas.items():
+                labels = {"key": key.name, "model": model}
+                yield "marcus_gemini_requests_per_minute", labels, quota.minute_requests.current()
+                yield "marcus_gemini_tokens_per_minute", labels, quota.minute_tokens.current()
+                yield "marcus_gemini_quota_blocked", labels, int(time.monotonic() < quota.blocked_until)
+
+
+def usage_tokens(response):
+    """Tokens Gemini says a call used; for a stream, the last chunk carries the total"""
+    if isinstance(response, list):
+        response = response[-1] if response else None
+    usage = getattr(response, "usage_metadata", None)
+    return (usage.total_token_count or 0) if usage is not None else 0
@@ -0,0 +1,126 @@
+# health.py
+# Liveness, readiness and degrade modes worked out from numbers the bot already has:
+# gateway latency, heartbeat ACKs, event loop lag and upstream error rates. No outbound calls.
+
+import asyncio
+import json
+import logging
+import math
+import time
+import metrics
+import retry
+
+logger = logging.getLogger(__name__)
+
+
+class HealthMonitor:
+    """Periodically reads the bot's own signals and decides whether it is live, ready and/or degraded"""
+
+    def __init__(self, client, interval=5, max_latency=5.0, max_loop_lag=0.5, max_error_rate=0.5, min_calls=5,
+                 reconnect_after=120, dead_after=900):
+        self.client = client
+        self.interval = interval
+        self.max_latency = max_latency          # seconds between heartbeat and ACK before we stop being ready
+        self.max_loop_lag = max_loop_lag        # seconds the loop may run late before extras are switched off
+        self.max_error_rate = max_error_rate    # failure share over the last 5 minutes that marks an upstream down
+        self.min_calls = min_calls              # calls needed before an error rate means anything
+        self.reconnect_after = reconnect_after  # seconds without a heartbeat ACK before forcing a reconnect
+        self.dead_after = dead_after            # seconds without a gateway connection before we stop being live
+        self.disconnected_since = time.monotonic()
+        self.checks = {}
+        self.degraded = {}                      # reason -> detail; random extras are skipped while this is set
+        self.ready = False
+        self.live = True
+
+    def heartbeat_age(self):
+        """Seconds since Discord last ACKed a heartbeat, or None without a gateway connection"""
+        keep_alive = getattr(self.client.ws, "_keep_alive", None)
+        last_ack = getattr(keep_alive, "_last_ack", None)
+        return None if last_ack is None else time.perf_counter() - last_ack
+
+    def evaluate(self):
+        """Recompute the checks and the live/ready/degraded states"""
+        now = time.monotonic()
+        connected = self.client.is_ready() and not self.client.is_closed()
+        if connected:
+            self.disconnected_since = None
+        elif self.disconnected_since is None:
+            self.disconnected_since = now
+        latency = self.client.latency
+        loop_lag = metrics.loop_lag_last.get()
+        heartbeat_age = self.heartbeat_age()
+        error_rates = {}
+        for upstream, tracker in list(retry.error_rates.items()):
+            rate, calls = tracker.rate()
+            if calls >= self.min_calls:
+                error_rates[upstream] = round(rate, 3)
+
+        self.checks = {
+            "connected": connected,
+            "latency": None if math.isnan(latency) or math.isinf(latency) else round(latency, 3),
+            "heartbeat_age": None if heartbeat_age is None else round(heartbeat_age, 1),
+            "loop_lag": round(loop_lag, 3),
+            "error_rates": error_rates,
+            "circuits_open": [name for name, breaker in retry.breakers.items() if breaker.state != "closed"],
+        }
+        self.live = self.disconnected_since is None or now - self.disconnected_since < self.dead_after
+        self.ready = connected and self.checks["latency"] is not None and latency <= self.max_latency
+
+        degraded = {}
+        if loop_lag > self.max_loop_lag:
+            degraded["loop_lag"] = round(loop_lag, 3)
+        if self.checks["latency"] is not None and latency > self.max_latency:
+            degraded["gateway_latency"] = round(latency, 3)
+        for upstream, rate in error_rates.items():
+            if rate > self.max_error_rate:
+                degraded[upstream] = rate
+        if degraded.keys() != self.degraded.keys():
+            if degraded:
+                logger.warning("Entering degraded mode", extra={"reasons": degraded})
+            else:
+                logger.info("Leaving degraded mode")
+        self.degraded = degraded
+
+    def snapshot(self):
+        return {"live": self.live, "ready": self.ready, "degraded": self.degraded, "checks": self.checks}
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.evaluate()
+                await self._reconnect_if_stuck()
+            except Exception:
+                logger.exception("Health check failed")
+
+    async def _reconnect_if_stuck(self):
+        # discord.py drops a silent gateway on its own; this covers the case where it thinks it is still connected
+        heartbeat_age = self.heartbeat_age()
+        if self.client.is_closed() or heartbeat_age is None or heartbeat_age < self.reconnect_after:
+            return
+        logger.warning("No heartbeat ACK, forcing a gateway reconnect", extra={"heartbeat_age": round(heartbeat_age)})
+        await self.client.ws.close(code=4000)
+
+    def samples(self):
+        """Gauges for the metrics endpoint"""
+        yield "marcus_live", {}, int(self.live)
+        yield "marcus_ready", {}, int(self.ready)
+        yield "marcus_degraded", {}, int(bool(self.degraded))
+
+    def routes(self):
+        """(path, handler) pairs for /healthz (liveness) and /readyz (readiness) on the metrics server"""
+        from aiohttp import web
+
+        def respond(ok):
+            return web.Response(text=json.dumps(self.snapshot()), status=200 if ok else 503,
+                                content_type="application/json")
+
+        async def liveness(request):
+            self.evaluate()
+            return respond(self.live)
+
+        async def readiness(request):
+            self.evaluate()
+            return respond(self.ready)
+
+        return [("/healthz", liveness), ("/readyz", readiness)]
@@ -0,0 +1,59 @@
+# http_client.py
+# One shared, connection-pooled aiohttp session for all outbound HTTP
+
+import aiohttp
+
+_session = None
+_settings = {"limit": 100, "limit_per_host": 10, "timeout": 30}
+
+
+async def start(limit=100, limit_per_host=10, timeout=30):
+    """Create the shared session if it isn't already open"""
+    _settings.update(limit=limit, limit_per_host=limit_per_host, timeout=timeout)
+    return get_session()
+
+
+def get_session():
+    """Return the shared session, opening one if needed (must be called inside the event loop)"""
+    global _session
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=_settings["limit"],                   # total pooled connections
+            limit_per_host=_settings["limit_per_host"], # so one slow host can't hog the pool
+            ttl_dns_cache=300,                          # cache DNS lookups for 5 minutes
+            keepalive_timeout=30,                       # reuse idle connections for 30 seconds
+        )
+        timeout = aiohttp.ClientTimeout(
+            total=_settings["timeout"],
+            connect=min(10, _settings["timeout"]),
+        )
+        _session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+    return _session
+
+
+async def close():
+    """Close the shared session and its pooled connections"""
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+
+async def get_json(url, params=None, timeout=None):
+    """GET a URL and decode the JSON body, raising aiohttp.ClientResponseError on a bad status"""
+    kwargs = {"params": params}
+    if timeout is not None:
+        kwargs["timeout"] = aiohttp.ClientTimeout(total=timeout)
+    async with get_session().get(url, **kwargs) as resp:
+        resp.raise_for_status()
+        return await resp.json(content_type=None)
+
+
+async def get_bytes(url, timeout=None):
+    """GET a URL and return the raw body, raising aiohttp.ClientResponseError on a bad status"""
+    kwargs = {}
+    if timeout is not None:
+        kwargs["timeout"] = aiohttp.ClientTimeout(total=timeout)
+    async with get_session().get(url, **kwargs) as resp:
+        resp.raise_for_status()
+        return await resp.read()
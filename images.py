@@ -0,0 +1,71 @@
+# images.py
+# Turns images returned by Gemini into Discord attachments without touching the disk
+
+import asyncio
+import datetime
+import os
+import uuid
+from io import BytesIO
+import discord
+
+# mime type -> file extension Discord uses to pick a preview
+extensions = {"image/png": "png", "image/jpeg": "jpg", "image/webp": "webp", "image/gif": "gif"}
+pil_formats = {"png": "PNG", "jpeg": "JPEG", "webp": "WEBP"}
+
+
+def response_images(response):
+    """Return (bytes, mime type) for every inline image in a Gemini response, or in a list of streamed chunks"""
+    images = []
+    for chunk in response if isinstance(response, list) else [response]:
+        for candidate in chunk.candidates or []:
+            if candidate.content is None:
+                continue
+            for part in candidate.content.parts or []:
+                if part.inline_data is not None and part.inline_data.data:
+                    images.append((part.inline_data.data, part.inline_data.mime_type or "image/png"))
+    return images
+
+
+def reencode(data, image_format, max_bytes):
+    """Re-encode an image as png/jpeg/webp, lowering quality and then size until it fits max_bytes.
+    Runs in a worker thread."""
+    from PIL import Image
+    image = Image.open(BytesIO(data))
+    if image_format == "jpeg" and image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    quality = 90
+    while True:
+        buffer = BytesIO()
+        image.save(buffer, pil_formats[image_format], quality=quality, optimize=True)
+        if buffer.tell() <= max_bytes or max(image.size) <= 256:
+            return buffer.getvalue()
+        if image_format != "png" and quality > 60:
+            quality -= 15
+        else:
+            image = image.resize((image.width * 3 // 4, image.height * 3 // 4), Image.LANCZOS)
+
+
+async def image_files(response, image_format=None, max_bytes=8 * 1024 * 1024, debug_dir=None):
+    """Build discord.File attachments from the images in a Gemini response (or list of streamed chunks).
+
+    Images are forwarded as-is unless image_format is set or they are bigger than max_bytes,
+    in which case they are re-encoded off the event loop."""
+    files = []
+    for index, (data, mime_type) in enumerate(response_images(response)):
+        extension = extensions.get(mime_type, "png")
+        if image_format in pil_formats or len(data) > max_bytes:
+            target = image_format if image_format in pil_formats else "webp"
+            data = await asyncio.to_thread(reencode, data, target, max_bytes)
+            extension = "jpg" if target == "jpeg" else target
+        if debug_dir:
+            await asyncio.to_thread(save_debug_copy, data, extension, debug_dir)
+        files.append(discord.File(BytesIO(data), filename=f"generated-image-{index + 1}.{extension}"))
+    return files
+
+
+def save_debug_copy(data, extension, debug_dir):
+    """Keep a copy of a generated image for debugging, with a unique name so concurrent images don't collide"""
+    os.makedirs(debug_dir, exist_ok=True)
+    name = f"{datetime.datetime.now():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:8]}.{extension}"
+    with open(os.path.join(debug_dir, name), "wb") as f:
+        f.write(data)
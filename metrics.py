@@ -0,0 +1,179 @@
+# metrics.py
+# Cheap in-process counters, gauges and latency histograms, served in Prometheus text format
+
+import asyncio
+import logging
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+_metrics = []       # every metric, in registration order
+_collectors = []    # functions returning extra (name, labels, value) gauge samples at scrape time
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key):
+    pairs = list(key)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{str(value).replace(chr(34), chr(39))}"' for name, value in pairs) + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels):
+        return self.values.get(_label_key(labels), 0)
+
+    def samples(self):
+        for key, value in self.values.items():
+            yield self.name, key, value
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        self.values[_label_key(labels)] = value
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = list(buckets)
+        self.values = {}    # label key -> [bucket counts..., sum, count]
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        entry = self.values.get(key)
+        if entry is None:
+            entry = self.values[key] = [0] * (len(self.buckets) + 2)
+        index = bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            entry[index] += 1
+        entry[-2] += value
+        entry[-1] += 1
+
+    def samples(self):
+        for key, entry in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, entry):
+                cumulative += count
+                yield f"{self.name}_bucket", key + (("le", bound),), cumulative
+            yield f"{self.name}_bucket", key + (("le", "+Inf"),), entry[-1]
+            yield f"{self.name}_sum", key, entry[-2]
+            yield f"{self.name}_count", key, entry[-1]
+
+
+def counter(name, help_text):
+    metric = Counter(name, help_text)
+    _metrics.append(metric)
+    return metric
+
+
+def gauge(name, help_text):
+    metric = Gauge(name, help_text)
+    _metrics.append(metric)
+    return metric
+
+
+def histogram(name, help_text, buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)):
+    metric = Histogram(name, help_text, buckets)
+    _metrics.append(metric)
+    return metric
+
+
+def add_collector(collect):
+    """Register a function returning (name, labels dict, value) samples, read on every scrape"""
+    _collectors.append(collect)
+
+
+stage_seconds = histogram("marcus_stage_seconds", "Time spent in each stage of handling a message")
+stage_in_flight = gauge("marcus_stage_in_flight", "Number of messages currently in each stage")
+stage_errors = counter("marcus_stage_errors_total", "Stages that ended with an exception")
+retries = counter("marcus_retries_total", "Retried upstream calls")
+rate_limited = counter("marcus_rate_limited_total", "Responses that told the bot to slow down (HTTP 429)")
+loop_lag = histogram("marcus_event_loop_lag_seconds", "How late the event loop ran a timer",
+                     buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5))
+loop_lag_last = gauge("marcus_event_loop_lag_last_seconds", "Most recent event loop lag sample")
+
+
+@contextmanager
+def stage(name):
+    """Time a stage of message handling: `with metrics.stage("gemini_chat"): ...`"""
+    stage_in_flight.inc(stage=name)
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        stage_errors.inc(stage=name)
+        raise
+    finally:
+        stage_seconds.observe(time.perf_counter() - start, stage=name)
+        stage_in_flight.dec(stage=name)
+
+
+async def monitor_loop_lag(interval=0.5):
+    """Sample how late the event loop wakes up from a sleep; a busy or blocked loop shows up as lag"""
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lag = max(0.0, time.perf_counter() - start - interval)
+        loop_lag.observe(lag)
+        loop_lag_last.set(lag)
+
+
+def render():
+    """Return every metric in Prometheus text exposition format"""
+    lines = []
+    for metric in _metrics:
+        lines.append(f"# HELP {metric.name} {metric.help_text}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, key, value in metric.samples():
+            lines.append(f"{name}{_format_labels(key)} {value}")
+    for collect in _collectors:
+        try:
+            for name, labels, value in collect():
+                lines.append(f"{name}{_format_labels(_label_key(labels))} {value}")
+        except Exception:
+            logger.exception("Metrics collector failed")
+    return "\n".join(lines) + "\n"
+
+
+async def start_server(port, host="127.0.0.1", routes=()):
+    """Serve /metrics (and any extra (path, handler) routes) on a local port. Returns the runner."""
+    from aiohttp import web
+
+    async def serve_metrics(request):
+        return web.Response(body=render().encode(),
+                            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+    app = web.Application()
+    app.router.add_get("/metrics", serve_metrics)
+    for path, handler in routes:
+        app.router.add_get(path, handler)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info("Metrics endpoint listening", extra={"host": host, "port": port})
+    return runner
@@ -0,0 +1,64 @@
+# nlp.py
+# Lazily loaded NLTK tokenizer and tagger used to pick GIF search terms
+#
+# Run `python3 nlp.py` once to vendor the NLTK data into ./nltk_data for offline startups.
+
+import logging
+import os
+import threading
+
+# NLTK resource name -> path nltk.data.find looks for
+resources = {
+    "punkt_tab": "tokenizers/punkt_tab",
+    "averaged_perceptron_tagger_eng": "taggers/averaged_perceptron_tagger_eng",
+}
+vendored_data = os.path.join(os.path.dirname(os.path.abspath(__file__)), "nltk_data")
+
+_ready = None   # None until the first load attempt, then True/False
+_lock = threading.Lock()
+logger = logging.getLogger(__name__)
+
+
+def load(offline=False):
+    """Make sure the NLTK data is available, downloading it only when not offline. Returns True when ready."""
+    global _ready
+    with _lock:
+        if _ready is not None:
+            return _ready
+        import nltk
+        if os.path.isdir(vendored_data) and vendored_data not in nltk.data.path:
+            nltk.data.path.insert(0, vendored_data)
+        missing = [name for name, path in resources.items() if not _has(nltk, path)]
+        if missing and not offline:
+            for name in missing:
+                nltk.download(name, quiet=True)
+            missing = [name for name, path in resources.items() if not _has(nltk, path)]
+        if missing:
+            logger.warning("NLTK data not available; random GIFs are disabled", extra={"missing": missing})
+        _ready = not missing
+        return _ready
+
+
+def nouns(text, offline=False):
+    """Return the nouns in a piece of text (empty if the NLTK data isn't available)"""
+    if not load(offline):
+        return []
+    from nltk.tokenize import word_tokenize
+    from nltk.tag import pos_tag
+    parts_of_speech_list = pos_tag(word_tokenize(text))
+    return [word for word, parts_of_speech in parts_of_speech_list if parts_of_speech.startswith('NN')]
+
+
+def _has(nltk, path):
+    try:
+        nltk.data.find(path)
+        return True
+    except LookupError:
+        return False
+
+
+if __name__ == "__main__":
+    import nltk
+    for name in resources:
+        nltk.download(name, download_dir=vendored_data)
+    print(f"NLTK data saved to {vendored_data}")
@@ -0,0 +1,220 @@
+# outbox.py
+# Queues outgoing Discord messages per channel and sends them within Discord's rate limits
+
+import asyncio
+import logging
+import time
+from collections import deque
+import discord
+import logs
+import metrics
+
+message_limit = 2000    # Discord's max characters per message
+
+logger = logging.getLogger(__name__)
+
+
+def split_message(text, limit=message_limit):
+    """Split text into chunks of at most limit characters, preferring to break at newlines, then spaces"""
+    chunks = []
+    while len(text) > limit:
+        cut = text.rfind("\n", 0, limit + 1)
+        if cut <= 0:
+            cut = text.rfind(" ", 0, limit + 1)
+        if cut <= 0:
+            cut = limit
+        chunks.append(text[:cut])
+        text = text[cut:].lstrip("\n ") if cut < len(text) else ""
+    if text or not chunks:
+        chunks.append(text)
+    return chunks
+
+
+class TokenBucket:
+    """Allows `capacity` actions at once, refilled at `rate` actions per second"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def delay(self):
+        """Seconds until an action may go ahead (0 if it may go now)"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        wait = max(0.0, self.paused_until - now)
+        if self.tokens < 1:
+            wait = max(wait, (1 - self.tokens) / self.rate)
+        return wait
+
+    async def take(self):
+        while True:
+            wait = self.delay()
+            if wait <= 0:
+                self.tokens -= 1
+                return
+            await asyncio.sleep(wait)
+
+    def pause(self, seconds):
+        """Hold every action for the given number of seconds (used when Discord says retry_after)"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+class OutgoingMessage:
+    def __init__(self, channel, content=None, files=None, edit_of=None):
+        self.channel = channel
+        self.content = content
+        self.files = files
+        self.edit_of = edit_of      # a sent discord.Message to edit instead of sending a new one
+        self.futures = [asyncio.get_running_loop().create_future()]
+        self.attempts = 0
+
+    def can_merge(self, other, limit):
+        return (not self.files and not other.files and self.edit_of is None and other.edit_of is None
+                and self.content is not None and other.content is not None
+                and len(self.content) + 1 + len(other.content) <= limit)
+
+
+class Outbox:
+    """Per-channel send queues drained by background workers, so handlers never sleep on rate limits"""
+
+    def __init__(self, channel_rate=1.0, channel_burst=5, global_rate=40.0, max_attempts=5):
+        self.channel_rate = channel_rate
+        self.channel_burst = channel_burst
+        self.max_attempts = max_attempts
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.queues = {}        # channel id -> deque of OutgoingMessage
+        self.buckets = {}       # channel id -> TokenBucket
+        self.workers = {}       # channel id -> task draining that channel's queue
+        self.sent = 0
+        self.rate_limited = 0
+        self.failed = 0
+
+    def send(self, channel, content=None, files=None):
+        """Queue a message and return a future for the sent discord.Message (None if it failed).
+        Text longer than 2000 characters is sent as several messages in order."""
+        if not content and not files:   # Discord rejects empty messages
+            future = asyncio.get_running_loop().create_future()
+            future.set_result(None)
+            return future
+        chunks = split_message(content) if content else [None]
+        queue = self.queues.setdefault(channel.id, deque())
+        for index, chunk in enumerate(chunks):
+            last = index == len(chunks) - 1
+            queue.append(OutgoingMessage(channel, chunk, files if last else None))
+        self._wake(channel.id)
+        return queue[-1].futures[0]
+
+    def edit(self, message, content):
+        """Queue an edit of a sent message and return a future for the edited message (None if it failed).
+        An edit still waiting in the queue is updated in place, so rapid edits cost one API call."""
+        content = content[:message_limit]
+        queue = self.queues.setdefault(message.channel.id, deque())
+        for item in queue:
+            if item.edit_of is message:
+                item.content = content
+                return item.futures[0]
+        queue.append(OutgoingMessage(message.channel, content, edit_of=message))
+        self._wake(message.channel.id)
+        return queue[-1].futures[0]
+
+    def _wake(self, channel_id):
+        worker = self.workers.get(channel_id)
+        if worker is None or worker.done():
+            self.workers[channel_id] = asyncio.create_task(self._drain(channel_id))
+
+    async def _drain(self, channel_id):
+        logs.request_id.set(None)   # the worker serves many messages, not the one that started it
+        queue = self.queues[channel_id]
+        bucket = self.buckets.setdefault(channel_id, TokenBucket(self.channel_rate, self.channel_burst))
+        try:
+            while queue:
+                item = queue.popleft()
+                # Merge a burst of short text messages into one send
+                while queue and item.can_merge(queue[0], message_limit):
+                    following = queue.popleft()
+                    item.content += "\n" + following.content
+                    item.futures += following.futures
+                await bucket.take()
+                await self.global_bucket.take()
+                await self._deliver(item, bucket, queue)
+        finally:
+            if not queue:
+                self.queues.pop(channel_id, None)
+                self.workers.pop(channel_id, None)
+                # Keep the bucket only while it still remembers recent sends or a pause
+                if bucket.delay() == 0 and bucket.tokens >= bucket.capacity:
+                    self.buckets.pop(channel_id, None)
+
+    async def _deliver(self, item, bucket, queue):
+        item.attempts += 1
+        try:
+            if item.edit_of is not None:
+                with metrics.stage("discord_edit"):
+                    sent = await item.edit_of.edit(content=item.content)
+            else:
+                with metrics.stage("discord_send"):
+                    sent = await item.channel.send(content=item.content, files=item.files)
+        except (discord.RateLimited, discord.HTTPException, OSError, asyncio.TimeoutError) as e:
+            retry_after = self._retry_after(e)
+            if retry_after is None or item.attempts >= self.max_attempts:
+                self._fail(item, e)
+                return
+            if isinstance(e, discord.RateLimited) or getattr(e, "status", None) == 429:
+                self.rate_limited += 1
+                metrics.rate_limited.inc(upstream="discord")
+                bucket.pause(retry_after)
+                if self._is_global(e):
+                    self.global_bucket.pause(retry_after)
+            else:
+                bucket.pause(retry_after)
+            logger.warning("Send failed, retrying",
+                           extra={"channel_id": item.channel.id, "error": str(e), "retry_after": retry_after})
+            for file in item.files or []:
+                file.reset()
+            queue.appendleft(item)
+            return
+        self.sent += 1
+        for future in item.futures:
+            if not future.done():
+                future.set_result(sent)
+
+    def _retry_after(self, error):
+        """How long to wait before retrying, or None if the error shouldn't be retried"""
+        if isinstance(error, discord.RateLimited):
+            return error.retry_after
+        if isinstance(error, discord.HTTPException):
+            if error.status == 429:
+                return float(error.response.headers.get("Retry-After", 1))
+            if error.status >= 500:
+                return 2.0
+            return None
+        return 2.0     # network errors
+
+    def _is_global(self, error):
+        response = getattr(error, "response", None)
+        return response is not None and response.headers.get("X-RateLimit-Global") == "true"
+
+    def _fail(self, item, error):
+        self.failed += 1
+        logger.error("Could not send message", extra={"channel_id": item.channel.id, "error": str(error)})
+        for future in item.futures:
+            if not future.done():
+                future.set_result(None)
+
+    def stats(self):
+        return {
+            "channels": len(self.queues),
+            "queued": sum(len(queue) for queue in self.queues.values()),
+            "sent": self.sent,
+            "rate_limited": self.rate_limited,
+            "failed": self.failed,
+        }
+
+    async def close(self):
+        for worker in list(self.workers.values()):
+            worker.cancel()
+        await asyncio.gather(*self.workers.values(), return_exceptions=True)
@@ -0,0 +1,105 @@
+# prompts.py
+# Builds what is sent to Gemini: the persona goes in the system instruction once per request,
+# and the user turn is stripped of prefixes and mentions and kept within a token limit
+
+import logging
+import re
+from sessions import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# The bot's persona for each kind of request, sent as the system instruction instead of in every user turn.
+# The image generation model rejects system instructions (400 INVALID_ARGUMENT), so its persona goes in the user turn.
+personas = {
+    "chat": "Use at most 2000 characters. You're very cool-headed. Speak like you are texting the user.",
+    "image": "Speak like you are texting the user.",
+}
+system_instruction_kinds = {"chat"}
+
+# Generation settings for each kind of request (temperature is between 0.1 and 2.0)
+generation_options = {
+    "chat": {},
+    "image": {"response_modalities": ["Text", "Image"], "temperature": 0.9},
+}
+
+_mention_pattern = re.compile(r"<(@[!&]?|#)(\d+)>")
+
+
+class PromptTooLongError(ValueError):
+    """Raised when a prompt is over the token limit and truncation is off"""
+
+    def __init__(self, tokens, max_tokens):
+        super().__init__(f"prompt is about {tokens} tokens, over the limit of {max_tokens}")
+        self.tokens = tokens
+        self.max_tokens = max_tokens
+
+
+class PromptBuilder:
+    """Turns Discord messages into Gemini user turns and configs"""
+
+    def __init__(self, prefixes, max_tokens=2000, truncate=True):
+        self.prefixes = sorted(prefixes, key=len, reverse=True)
+        self.max_tokens = max_tokens    # estimated tokens a user turn may use
+        self.truncate = truncate        # cut oversized prompts down instead of rejecting them
+        self.truncated = 0
+        self.rejected = 0
+        # Only a prefix standing on its own counts, so "Sam?" or "hmm?" keep their last letters
+        self._pattern = re.compile(r"(?<!\S)(?:" + "|".join(re.escape(prefix) for prefix in self.prefixes) + r")(?!\S)")
+        self._configs = {}
+
+    def clean(self, message, bot_user=None):
+        """The message text without prefixes or the bot's mention; other mentions become readable names"""
+        names = {}
+        for user in message.mentions:
+            names["@" + str(user.id)] = "@" + getattr(user, "display_name", user.name)
+        for role in getattr(message, "role_mentions", []):
+            names["@&" + str(role.id)] = "@" + role.name
+        for channel in getattr(message, "channel_mentions", []):
+            names["#" + str(channel.id)] = "#" + channel.name
+        bot_id = str(bot_user.id) if bot_user is not None else None
+
+        def replace(match):
+            kind, mentioned = match.group(1).replace("!", ""), match.group(2)
+            if kind == "@" and mentioned == bot_id:
+                return " "
+            return names.get(kind + mentioned, match.group(0))
+
+        text = self._pattern.sub(" ", message.content)
+        text = _mention_pattern.sub(replace, text)
+        return " ".join(text.split())
+
+    def user_text(self, message, bot_user=None):
+        """The text to send for a message, checked against the token limit.
+        Raises PromptTooLongError for oversized prompts when truncation is off."""
+        # A bare prefix or mention has nothing left; send it as typed rather than an empty turn
+        text = self.clean(message, bot_user) or message.content
+        tokens = estimate_tokens(text)
+        if tokens <= self.max_tokens:
+            return text
+        if not self.truncate:
+            self.rejected += 1
+            raise PromptTooLongError(tokens, self.max_tokens)
+        self.truncated += 1
+        logger.info("Truncated an oversized prompt", extra={"tokens": tokens, "max_tokens": self.max_tokens})
+        cut = text[:self.max_tokens * 4]
+        return cut[:cut.rfind(" ")] if " " in cut else cut
+
+    def user_turn(self, kind, text):
+        """The text of the user turn, with the persona in front for kinds that can't take a system instruction"""
+        return text if kind in system_instruction_kinds else personas[kind] + " " + text
+
+    def config(self, kind):
+        """The GenerateContentConfig with the persona and settings for this kind of request (built once per kind)"""
+        config = self._configs.get(kind)
+        if config is None:
+            from google.genai import types
+            system_instruction = personas[kind] if kind in system_instruction_kinds else None
+            config = self._configs[kind] = types.GenerateContentConfig(system_instruction=system_instruction,
+                                                                       **generation_options[kind])
+        return config
+
+    def system_tokens(self, kind):
+        return estimate_tokens(personas[kind])
+
+    def stats(self):
+        return {"truncated": self.truncated, "rejected": self.rejected}
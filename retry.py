@@ -0,0 +1,254 @@
+# retry.py
+# One async retry engine: error classification, jittered backoff, per-upstream circuit breakers
+# and a global retry budget
+
+import asyncio
+import logging
+import random
+import sys
+import time
+from collections import deque
+import aiohttp
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream that is known to be down"""
+
+
+class RetryLater(Exception):
+    """Raised by our own quota tracking when a call can't be made before `retry_after` seconds"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+# HTTP statuses worth retrying: timeouts, rate limits and server errors
+retryable_statuses = {408, 425, 429, 500, 502, 503, 504}
+
+
+def _parse_seconds(value):
+    """Read a retry hint like "12", "12s" or "1.5s" as seconds"""
+    try:
+        return float(str(value).strip().rstrip("s"))
+    except (TypeError, ValueError):
+        return None
+
+
+def classify(error):
+    """Return (retryable, retry_after) for an exception. retry_after is the server's hint in seconds, if any."""
+    if isinstance(error, CircuitOpenError):
+        return False, None
+    if isinstance(error, RetryLater):
+        return True, error.retry_after
+
+    # Gemini (google-genai) errors: 4xx are our fault except rate limits and timeouts, 5xx are theirs
+    if "google.genai" in sys.modules:
+        from google.genai import errors as genai_errors
+        if isinstance(error, genai_errors.APIError):
+            retry_after = None
+            response = getattr(error, "response", None)
+            headers = getattr(response, "headers", None)
+            if headers is not None and headers.get("retry-after"):
+                retry_after = _parse_seconds(headers.get("retry-after"))
+            details = error.details.get("error", error.details) if isinstance(error.details, dict) else {}
+            for detail in details.get("details", []) if isinstance(details, dict) else []:
+                if isinstance(detail, dict) and "retryDelay" in detail:
+                    retry_after = _parse_seconds(detail["retryDelay"])
+            return error.code in retryable_statuses, retry_after
+
+    # HTTP errors from aiohttp (Tenor, Discord CDN)
+    if isinstance(error, aiohttp.ClientResponseError):
+        retry_after = _parse_seconds(error.headers.get("Retry-After")) if error.headers else None
+        return error.status in retryable_statuses, retry_after
+
+    # Network trouble is always worth another try
+    if isinstance(error, (aiohttp.ClientError, OSError, ConnectionError, asyncio.TimeoutError)):
+        return True, None
+
+    # Bugs and bad input won't fix themselves
+    if isinstance(error, (ValueError, TypeError, AttributeError, KeyError, IndexError)):
+        return False, None
+
+    return True, None
+
+
+def _status(error):
+    """The HTTP status of an error, if it has one"""
+    status = getattr(error, "code", None)
+    if not isinstance(status, int):
+        status = getattr(error, "status", None)
+    return status if isinstance(status, int) else None
+
+
+class CircuitBreaker:
+    """Stops calling an upstream after repeated failures, then lets a single trial call through after a cooldown"""
+
+    def __init__(self, name, failure_threshold=5, cooldown=30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0           # consecutive retryable failures
+        self.opened_at = None
+        self.trial_running = False
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return "half-open"
+        return "open"
+
+    def check(self):
+        """Raise CircuitOpenError if calls to this upstream should fail fast right now"""
+        state = self.state
+        if state == "open" or (state == "half-open" and self.trial_running):
+            raise CircuitOpenError(f"{self.name} is unavailable (circuit open)")
+        if state == "half-open":
+            self.trial_running = True
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.trial_running = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+
+class RetryBudget:
+    """Caps retries to a fraction of calls, so an outage doesn't multiply the load on an upstream"""
+
+    def __init__(self, ratio=0.2, max_tokens=20):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+
+    def record_call(self):
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def try_spend(self):
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class ErrorRate:
+    """Share of failed calls to an upstream over the last `window` seconds"""
+
+    def __init__(self, window=300):
+        self.window = window
+        self.events = deque()       # (time, failed) for every call in the window
+        self.failures = 0
+
+    def record(self, failed):
+        now = time.monotonic()
+        self.events.append((now, failed))
+        self.failures += failed
+        self._expire(now)
+
+    def rate(self):
+        """Return (failure rate, number of calls) over the window"""
+        self._expire(time.monotonic())
+        calls = len(self.events)
+        return (self.failures / calls if calls else 0.0), calls
+
+    def _expire(self, now):
+        while self.events and now - self.events[0][0] > self.window:
+            _, failed = self.events.popleft()
+            self.failures -= failed
+
+
+breakers = {}
+error_rates = {}
+retry_budget = RetryBudget()
+
+
+def get_breaker(upstream):
+    """Return the circuit breaker for an upstream, e.g. "gemini-chat", "gemini-image", "tenor" or "discord-cdn\""""
+    breaker = breakers.get(upstream)
+    if breaker is None:
+        breaker = breakers[upstream] = CircuitBreaker(upstream)
+    return breaker
+
+
+def get_error_rate(upstream):
+    """Return the rolling error rate tracker for an upstream"""
+    tracker = error_rates.get(upstream)
+    if tracker is None:
+        tracker = error_rates[upstream] = ErrorRate()
+    return tracker
+
+
+async def retry_with_backoff(func, max_retries=3, initial_delay=1, max_delay=30, operation_name="operation",
+                             upstream=None):
+    """Await func(), retrying retryable errors with jittered exponential backoff.
+
+    Fatal errors (bad requests, auth, safety blocks, bugs) are raised straight away. With an upstream name,
+    calls fail fast with CircuitOpenError while that upstream's circuit breaker is open."""
+    breaker = get_breaker(upstream) if upstream else None
+    errors = get_error_rate(upstream) if upstream else None
+    retry_budget.record_call()
+    for attempt in range(max_retries):
+        if breaker is not None:
+            breaker.check()
+        try:
+            result = await func()
+        except asyncio.CancelledError:
+            if breaker is not None:
+                breaker.trial_running = False
+            raise
+        except Exception as e:
+            retryable, retry_after = classify(e)
+            if _status(e) == 429:
+                metrics.rate_limited.inc(upstream=upstream or operation_name)
+            # Bad requests and our own quota limits are not a sign the upstream is unwell
+            upstream_failed = retryable and not isinstance(e, RetryLater)
+            if errors is not None:
+                errors.record(upstream_failed)
+            if breaker is not None and upstream_failed:
+                breaker.record_failure()
+            elif breaker is not None:
+                breaker.trial_running = False
+            if not retryable:
+                if breaker is not None:
+                    breaker.record_success()     # the upstream answered; the request itself was bad
+                logger.warning("Non-retryable error", extra={"operation": operation_name, "error": str(e)})
+                raise
+            if attempt == max_retries - 1 or not retry_budget.try_spend():
+                logger.error("Giving up", extra={"operation": operation_name, "attempts": attempt + 1, "error": str(e)})
+                raise
+            if retry_after is not None and retry_after > max_delay:
+                logger.error("Giving up, server asked to wait too long",
+                             extra={"operation": operation_name, "retry_after": retry_after, "error": str(e)})
+                raise
+            # Full jitter spreads retries out; a server hint is a lower bound
+            retry_delay = random.uniform(0, min(initial_delay * (2 ** attempt), max_delay))
+            if retry_after is not None:
+                retry_delay = max(retry_delay, retry_after)
+            logger.warning("Retrying", extra={"operation": operation_name, "error": str(e), "delay": round(retry_delay, 2),
+                                              "attempt": attempt + 1, "max_retries": max_retries})
+            metrics.retries.inc(upstream=upstream or operation_name)
+            await asyncio.sleep(retry_delay)
+        else:
+            if errors is not None:
+                errors.record(False)
+            if breaker is not None:
+                breaker.record_success()
+            return result
+
+
+def stats():
+    return {
+        "retry_budget": round(retry_budget.tokens, 1),
+        "breakers": {name: breaker.state for name, breaker in breakers.items()},
+        "error_rates": {name: round(tracker.rate()[0], 3) for name, tracker in error_rates.items()},
+    }
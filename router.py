@@ -0,0 +1,65 @@
+# router.py
+# Decides which handlers a message should run, before any NLP or API work is done
+
+import re
+import commands
+
+
+class Router:
+    """Registry of message handlers with a single compiled matcher for prefixes and bot mentions"""
+
+    def __init__(self, prefixes):
+        self.prefixes = list(prefixes)
+        self.exact_commands = {}    # exact message text -> handler
+        self.chance_handlers = []   # (probability, handler) run at random on any message
+        self.addressed_handler = None
+        self._bot_id = None
+        self._pattern = self._compile(None)
+
+    def command(self, text):
+        """Register a handler for messages that are exactly `text`"""
+        def decorator(handler):
+            self.exact_commands[text] = handler
+            return handler
+        return decorator
+
+    def random(self, chance):
+        """Register a handler that runs on any message with the given probability"""
+        def decorator(handler):
+            self.chance_handlers.append((chance, handler))
+            return handler
+        return decorator
+
+    def addressed(self, handler):
+        """Register the handler for messages meant for the bot (prefix, mention or reply)"""
+        self.addressed_handler = handler
+        return handler
+
+    def is_addressed(self, message, bot_user):
+        """True if the message uses a prefix, mentions the bot or replies to one of the bot's messages"""
+        if bot_user is not None and bot_user.id != self._bot_id:
+            self._bot_id = bot_user.id
+            self._pattern = self._compile(bot_user.id)
+        if self._pattern.search(message.content):
+            return True
+        reference = message.reference
+        if reference is None or message.mention_everyone:
+            return False
+        replied_to = reference.resolved
+        return replied_to is not None and getattr(replied_to, "author", None) == bot_user
+
+    def route(self, message, bot_user):
+        """Return the handlers to run for a message, in order"""
+        handlers = [handler for chance, handler in self.chance_handlers if commands.random_chance(chance)]
+        command_handler = self.exact_commands.get(message.content)
+        if command_handler is not None:
+            handlers.append(command_handler)
+        elif self.addressed_handler is not None and self.is_addressed(message, bot_user):
+            handlers.append(self.addressed_handler)
+        return handlers
+
+    def _compile(self, bot_id):
+        alternatives = [re.escape(prefix) for prefix in self.prefixes]
+        if bot_id is not None:
+            alternatives.append(f"<@!?{bot_id}>")
+        return re.compile("|".join(alternatives))
@@ -0,0 +1,85 @@
+# scheduler.py
+# Bounds how many upstream requests run at once, globally and per guild
+
+import asyncio
+import heapq
+import itertools
+
+
+class PrioritySemaphore:
+    """A semaphore that wakes waiters lowest priority number first, then first come, first served"""
+
+    def __init__(self, value):
+        self.value = value
+        self._waiters = []      # heap of (priority, arrival, future)
+        self._arrivals = itertools.count()
+
+    async def acquire(self, priority=0):
+        if self.value > 0 and not self._waiters:
+            self.value -= 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._arrivals), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()      # we were handed a slot just as we were cancelled; pass it on
+            else:
+                future.cancel()     # release() skips it
+            raise
+
+    def release(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self.value += 1
+
+    def waiting(self):
+        return sum(1 for _, _, future in self._waiters if not future.done())
+
+
+class RequestScheduler:
+    """Limit concurrent upstream calls with a global cap and a per-guild cap"""
+
+    def __init__(self, global_limit=32, guild_limit=8):
+        self.global_limit = global_limit
+        self.guild_limit = guild_limit
+        self.in_flight = 0
+        self._global = PrioritySemaphore(global_limit)
+        self._guilds = {}   # guild id -> [semaphore, number of tasks holding or waiting on it]
+
+    async def run(self, guild_id, func, priority=0):
+        """Await func() once both a global slot and a slot for the guild are free.
+        When global slots are scarce, lower priority numbers get them first."""
+        entry = self._guilds.get(guild_id)
+        if entry is None:
+            entry = self._guilds[guild_id] = [asyncio.Semaphore(self.guild_limit), 0]
+        entry[1] += 1
+        try:
+            # Take the guild slot first so one busy guild can't hold every global slot while it waits
+            async with entry[0]:
+                await self._global.acquire(priority)
+                self.in_flight += 1
+                try:
+                    return await func()
+                finally:
+                    self.in_flight -= 1
+                    self._global.release()
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                # Drop idle guilds so the table doesn't grow with every server the bot has ever seen
+                self._guilds.pop(guild_id, None)
+
+    def stats(self):
+        """Return a snapshot of the scheduler's load"""
+        return {
+            "in_flight": self.in_flight,
+            "global_limit": self.global_limit,
+            "guild_limit": self.guild_limit,
+            "active_guilds": len(self._guilds),
+            "waiting": self._global.waiting(),
+        }
@@ -0,0 +1,162 @@
+# sessions.py
+# Per-channel (or per-user) Gemini chat sessions with bounded history
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_tokens(text):
+    """Roughly estimate the number of tokens in a piece of text (about 4 characters per token)"""
+    return len(text) // 4 + 1
+
+
+def content_tokens(content):
+    """Estimate the tokens used by one turn of chat history"""
+    return sum(estimate_tokens(part.text) for part in content.parts or [] if part.text)
+
+
+def turn_text(content):
+    return "".join(part.text for part in content.parts or [] if part.text)
+
+
+class ChatSession:
+    """One conversation with Gemini whose history is trimmed to a token budget"""
+
+    def __init__(self, key, token_budget, store=None):
+        self.key = key
+        self.token_budget = token_budget
+        self.store = store                  # optional ConversationStore the turns are saved to
+        self.history = []                   # alternating user/model types.Content turns
+        self.loaded = store is None         # whether the saved history has been read back
+        self.next_seq = 0
+        self.last_used = time.monotonic()
+        self.lock = asyncio.Lock()          # one turn at a time so the history stays in order
+
+    async def load(self):
+        """Read the saved history the first time the conversation is used after a restart (or eviction)"""
+        if self.loaded:
+            return
+        from google.genai import types
+        try:
+            turns, self.next_seq = await self.store.load(self.key)
+        except Exception:
+            logger.exception("Could not load chat history", extra={"conversation": str(self.key)})
+            return
+        while turns and turns[0][0] != "user":     # compaction may have cut a user/model pair in half
+            turns.pop(0)
+        self.history = [types.Content(role=role, parts=[types.Part.from_text(text=text)]) for role, text in turns]
+        self.trim()
+        self.loaded = True
+
+    def record(self, user_turn, model_turn):
+        """Add a finished user/model exchange to the history (and queue it to be saved)"""
+        self.history += [user_turn, model_turn]
+        self.trim()
+        if self.store is not None and self.loaded:
+            self.store.append(self.key, self.next_seq, "user", turn_text(user_turn))
+            self.store.append(self.key, self.next_seq + 1, "model", turn_text(model_turn))
+            self.next_seq += 2
+
+    async def send_message(self, google_client, model, text, config=None):
+        """Send a user turn with the session's history and record the reply"""
+        from google.genai import types
+        user_turn = types.Content(role="user", parts=[types.Part.from_text(text=text)])
+        async with self.lock:
+            await self.load()
+            response = await google_client.aio.models.generate_content(
+                model=model,
+                contents=self.history + [user_turn],
+                config=config,
+            )
+            if response.candidates and response.candidates[0].content:
+                self.record(user_turn, response.candidates[0].content)
+        self.last_used = time.monotonic()
+        return response
+
+    async def stream_message(self, google_client, model, text, config=None):
+        """Like send_message, but yields the reply in chunks as it is generated.
+        The turn is added to the history once the stream has finished."""
+        from google.genai import types
+        user_turn = types.Content(role="user", parts=[types.Part.from_text(text=text)])
+        async with self.lock:
+            await self.load()
+            stream = await google_client.aio.models.generate_content_stream(
+                model=model,
+                contents=self.history + [user_turn],
+                config=config,
+            )
+            reply = []
+            async for chunk in stream:
+                if chunk.candidates and chunk.candidates[0].content:
+                    reply += [part.text for part in chunk.candidates[0].content.parts or [] if part.text]
+                yield chunk
+            if reply:
+                self.record(user_turn, types.Content(role="model", parts=[types.Part.from_text(text="".join(reply))]))
+        self.last_used = time.monotonic()
+
+    def history_tokens(self):
+        return sum(content_tokens(content) for content in self.history)
+
+    def trim(self):
+        """Drop the oldest user/model pairs until the history fits the token budget"""
+        total = self.history_tokens()
+        while total > self.token_budget and len(self.history) > 2:
+            total -= content_tokens(self.history[0]) + content_tokens(self.history[1])
+            del self.history[:2]
+
+
+class ChatSessionManager:
+    """Keeps a bounded set of chat sessions keyed by channel, or by channel and user"""
+
+    def __init__(self, max_sessions=500, idle_ttl=3600, token_budget=8000, per_user=False, store=None):
+        self.store = store              # optional ConversationStore; evicted sessions are reloaded from it
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.token_budget = token_budget
+        self.per_user = per_user
+        self.sessions = OrderedDict()   # least recently used first
+
+    def key_for(self, message):
+        if self.per_user:
+            return (message.channel.id, message.author.id)
+        return message.channel.id
+
+    def get(self, message):
+        """Return the session for a message, creating it and evicting old sessions as needed"""
+        self.evict_idle()
+        key = self.key_for(message)
+        session = self.sessions.get(key)
+        if session is None:
+            session = self.sessions[key] = ChatSession(key, self.token_budget, self.store)
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+        else:
+            self.sessions.move_to_end(key)
+        session.last_used = time.monotonic()
+        return session
+
+    def evict_idle(self):
+        """Drop sessions that haven't been used within the idle TTL"""
+        cutoff = time.monotonic() - self.idle_ttl
+        while self.sessions:
+            key, session = next(iter(self.sessions.items()))
+            if session.last_used >= cutoff:
+                break
+            del self.sessions[key]
+
+    async def send_message(self, message, google_client, model, text, config=None):
+        """Send text in the conversation the message belongs to, with whichever client and model have quota"""
+        session = self.get(message)
+        return await session.send_message(google_client, model, text, config=config)
+
+    def stream_message(self, message, google_client, model, text, config=None):
+        """Stream a reply in the conversation the message belongs to (an async iterator of chunks)"""
+        session = self.get(message)
+        return session.stream_message(google_client, model, text, config=config)
+
+    def clear(self):
+        self.sessions.clear()
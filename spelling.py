@@ -0,0 +1,134 @@
+# spelling.py
+# Spell correction for trigger words, loaded once and memoized per word
+
+import re
+import string
+from functools import lru_cache
+
+_speller = None
+
+# Tokens that are never worth correcting: urls, Discord mentions/emoji/channels, and anything without letters
+_skip_pattern = re.compile(r"^(https?://|www\.|<[@#:a]|:\w+:$)|^[^a-zA-Z]*$")
+
+
+def get_speller():
+    """Return the process-wide Speller, loading its language model on first use"""
+    global _speller
+    if _speller is None:
+        from autocorrect import Speller
+        _speller = Speller()
+    return _speller
+
+
+def should_skip(token):
+    return _skip_pattern.search(token) is not None
+
+
+@lru_cache(maxsize=8192)
+def correct_word(word):
+    """Full dictionary correction for one word"""
+    corrected = get_speller()(word)
+    return corrected if corrected is not None else word
+
+
+def edit_distance(a, b, limit):
+    """Edit distance counting adjacent swaps as one edit, or limit + 1 once it is known to exceed limit"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous_row = None
+    row = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        before_previous, previous_row = previous_row, row
+        row = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            row[j] = min(previous_row[j] + 1, row[j - 1] + 1, previous_row[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                row[j] = min(row[j], before_previous[j - 2] + 1)
+        if min(row) > limit:
+            return limit + 1
+    return row[-1]
+
+
+def is_known_word(word):
+    """True for words in the speller's dictionary (or their plurals), which are real words and not typos"""
+    words = get_speller().nlp_data     # case-sensitive: "carton" is only listed as "Carton"
+    forms = [word, word[:-1]] if word.endswith("s") else [word]
+    return any(form in words or form.capitalize() in words for form in forms)
+
+
+def allowed_edits(word):
+    """How many typos we forgive for a word of this length"""
+    if len(word) <= 3:
+        return 0
+    if len(word) <= 6:
+        return 1
+    return 2
+
+
+def deletes(word, depth):
+    """Every string made by deleting up to depth characters from word"""
+    variants = {word}
+    frontier = {word}
+    for _ in range(depth):
+        frontier = {variant[:i] + variant[i + 1:] for variant in frontier for i in range(len(variant))}
+        variants |= frontier
+    return variants
+
+
+@lru_cache(maxsize=16)
+def delete_index(vocabulary):
+    """Map each deletion variant of the vocabulary words back to the words, so lookups skip most comparisons"""
+    index = {}
+    for candidate in vocabulary:
+        for variant in deletes(candidate, allowed_edits(candidate)):
+            index.setdefault(variant, set()).add(candidate)
+    return index
+
+
+@lru_cache(maxsize=8192)
+def match_trigger(word, vocabulary):
+    """Return the vocabulary word the token is a typo of, or the token itself"""
+    if word in vocabulary:
+        return word
+    index = delete_index(vocabulary)
+    candidates = set()
+    for variant in deletes(word, 2):
+        candidates |= index.get(variant, set())
+    # "lecture" is a couple of edits from "picture", but it is a word in its own right
+    if not candidates or is_known_word(word):
+        return word
+    best, best_distance = word, None
+    for candidate in candidates:
+        limit = allowed_edits(candidate)
+        distance = edit_distance(word, candidate, limit)
+        if distance <= limit and (best_distance is None or distance < best_distance):
+            best, best_distance = candidate, distance
+    return best
+
+
+def correct_tokens(text, vocabulary=(), mode="triggers"):
+    """Split text on whitespace and correct each token.
+
+    mode "triggers" only fixes typos of words in the vocabulary, "full" runs the whole dictionary
+    speller and "off" returns the tokens untouched."""
+    vocabulary = frozenset(vocabulary)
+    corrected_tokens = []
+    for token in text.split():
+        if mode == "off" or should_skip(token):
+            corrected_tokens.append(token)
+        elif mode == "full":
+            corrected_tokens.append(correct_word(token))
+        else:
+            match = match_trigger(token.lower().strip(string.punctuation), vocabulary)
+            corrected_tokens.append(match if match in vocabulary else token)
+    return corrected_tokens
+
+
+def cache_info():
+    return {"words": correct_word.cache_info()._asdict(), "triggers": match_trigger.cache_info()._asdict()}
+
+
+def clear_cache():
+    correct_word.cache_clear()
+    match_trigger.cache_clear()
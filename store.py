@@ -0,0 +1,178 @@
+# store.py
+# SQLite-backed chat history, so conversations survive restarts. All database work runs on one worker thread.
+
+import asyncio
+import logging
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+schema = """
+CREATE TABLE IF NOT EXISTS turns (
+    conversation TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    text TEXT NOT NULL,
+    created REAL NOT NULL,
+    PRIMARY KEY (conversation, seq)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS conversations (
+    conversation TEXT PRIMARY KEY,
+    updated REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS conversations_updated ON conversations (updated);
+"""
+
+
+def conversation_id(key):
+    """The text key of a session key: a channel id, or a (channel id, user id) tuple"""
+    return ":".join(str(part) for part in key) if isinstance(key, tuple) else str(key)
+
+
+class ConversationStore:
+    """Keeps every conversation's recent turns in SQLite.
+
+    Appends are queued in memory and written in batches; compaction drops the turns that no longer fit
+    the history token budget and conversations that have been idle for longer than `retention` seconds."""
+
+    def __init__(self, path, token_budget=8000, retention=30 * 86400, flush_interval=2.0, compact_interval=3600,
+                 max_pending=10000):
+        self.path = path
+        self.token_budget = token_budget
+        self.retention = retention
+        self.flush_interval = flush_interval
+        self.compact_interval = compact_interval
+        self.max_pending = max_pending
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="store")   # owns the connection
+        self.db = None
+        self.pending = []           # (conversation, seq, role, text, created) rows not yet written
+        self.writing = []           # the batch being written right now
+        self.dirty = set()          # conversations with new turns since the last compaction
+        self.written = 0
+        self.dropped = 0
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    def _connect(self):
+        if self.db is None:
+            self.db = sqlite3.connect(self.path)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")   # with WAL, a crash can lose the last batch but not corrupt
+            self.db.executescript(schema)
+        return self.db
+
+    async def load(self, key):
+        """Return [(role, text), ...] for a conversation, oldest first, and the next sequence number"""
+        conversation = conversation_id(key)
+        # Turns not written yet belong to the history too
+        unsaved = [row for row in self.writing + self.pending if row[0] == conversation]
+        turns = {seq: (role, text) for seq, role, text in await self._run(self._load, conversation)}
+        turns.update((seq, (role, text)) for _, seq, role, text, _ in unsaved)
+        return [turns[seq] for seq in sorted(turns)], (max(turns) + 1 if turns else 0)
+
+    def _load(self, conversation):
+        return self._connect().execute(
+            "SELECT seq, role, text FROM turns WHERE conversation = ? ORDER BY seq", (conversation,)
+        ).fetchall()
+
+    def append(self, key, seq, role, text):
+        """Queue one turn to be written with the next batch"""
+        if len(self.pending) >= self.max_pending:
+            self.pending.pop(0)     # the database is failing or far behind; keep memory bounded
+            self.dropped += 1
+        conversation = conversation_id(key)
+        self.pending.append((conversation, seq, role, text, time.time()))
+        self.dirty.add(conversation)
+
+    async def flush(self):
+        if self.dropped:
+            logger.warning("Chat history store fell behind; unsaved turns were dropped", extra={"turns": self.dropped})
+            self.dropped = 0
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, []
+        self.writing = batch
+        try:
+            await self._run(self._write, batch)
+            self.written += len(batch)
+        except Exception:
+            logger.exception("Could not save chat history; will retry", extra={"turns": len(batch)})
+            self.pending = batch + self.pending
+        finally:
+            self.writing = []
+
+    def _write(self, batch):
+        db = self._connect()
+        with db:
+            db.executemany("INSERT OR REPLACE INTO turns VALUES (?, ?, ?, ?, ?)", batch)
+            updated = {}
+            for conversation, _, _, _, created in batch:
+                updated[conversation] = max(created, updated.get(conversation, 0))
+            db.executemany("INSERT OR REPLACE INTO conversations VALUES (?, ?)", updated.items())
+
+    async def compact(self):
+        """Drop turns outside the token budget (for conversations that changed) and expired conversations"""
+        await self.flush()
+        dirty, self.dirty = self.dirty, set()
+        removed = await self._run(self._compact, sorted(dirty), time.time() - self.retention)
+        if removed:
+            logger.info("Compacted chat history", extra={"removed_turns": removed})
+
+    def _compact(self, conversations, cutoff):
+        db = self._connect()
+        removed = 0
+        with db:
+            for conversation in conversations:
+                # Newest first, keeping whole turns while the running token estimate fits the budget
+                removed += db.execute("""
+                    DELETE FROM turns WHERE conversation = ? AND seq < (
+                        SELECT COALESCE(MIN(seq), 0) FROM (
+                            SELECT seq, SUM(LENGTH(text) / 4 + 1) OVER (ORDER BY seq DESC) AS tokens
+                            FROM turns WHERE conversation = ?
+                        ) WHERE tokens <= ?
+                    )""", (conversation, conversation, self.token_budget)).rowcount
+            expired = [row[0] for row in db.execute(
+                "SELECT conversation FROM conversations WHERE updated < ?", (cutoff,))]
+            for conversation in expired:
+                removed += db.execute("DELETE FROM turns WHERE conversation = ?", (conversation,)).rowcount
+            db.execute("DELETE FROM conversations WHERE updated < ?", (cutoff,))
+        return removed
+
+    async def clear(self):
+        """Forget every conversation"""
+        self.pending = []
+        self.dirty = set()
+        await self._run(self._clear)
+
+    def _clear(self):
+        db = self._connect()
+        with db:
+            db.execute("DELETE FROM turns")
+            db.execute("DELETE FROM conversations")
+
+    async def run(self):
+        """Write queued turns every flush_interval seconds and compact every compact_interval seconds"""
+        last_compaction = time.monotonic()
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+            if time.monotonic() - last_compaction >= self.compact_interval:
+                last_compaction = time.monotonic()
+                try:
+                    await self.compact()
+                except Exception:
+                    logger.exception("Chat history compaction failed")
+
+    def stats(self):
+        return {"pending": len(self.pending), "written": self.written, "dirty": len(self.dirty)}
+
+    async def close(self):
+        """Write what is still queued and close the database"""
+        await self.flush()
+        if self.db is not None:
+            await self._run(self.db.close)
+            self.db = None
+        self.executor.shutdown(wait=True)
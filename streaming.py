@@ -0,0 +1,89 @@
+# streaming.py
+# Shows a Gemini answer while it is being generated: one Discord message that is edited as text arrives
+
+import logging
+import time
+from contextlib import aclosing
+from outbox import message_limit, split_message
+
+logger = logging.getLogger(__name__)
+
+
+class StreamingReply:
+    """A reply posted as soon as the first text arrives, then edited at most every `edit_interval` seconds.
+    Past 2000 characters the current message is finished and the text continues in a new one."""
+
+    def __init__(self, outbox, channel, edit_interval=1.0):
+        self.outbox = outbox
+        self.channel = channel
+        self.edit_interval = edit_interval
+        self.message = None     # the discord.Message being edited
+        self.text = ""          # what that message should say
+        self.shown = ""         # what it was last sent or edited to
+        self.last_edit = 0.0
+        self.pending = None     # future of the latest queued edit
+        self.started = False    # True once anything was posted, after which errors can't be retried
+        self.failed = False
+
+    async def append(self, text):
+        if not text:
+            return
+        self.text += text
+        while len(self.text) > message_limit:
+            head, rest = self._split()
+            self.text = head
+            await self._flush(final=True)
+            self.message, self.text, self.shown = None, rest, ""
+        await self._flush()
+
+    async def finish(self):
+        """Make sure the last of the text is shown; returns once Discord has it"""
+        await self._flush(final=True)
+        if self.pending is not None:
+            await self.pending
+
+    def _split(self):
+        chunks = split_message(self.text, message_limit)
+        return chunks[0], self.text[len(chunks[0]):].lstrip("\n ")
+
+    async def _flush(self, final=False):
+        if self.failed or not self.text.strip() or self.text == self.shown:
+            return
+        if self.message is None:
+            # The first message is awaited so later edits have something to edit
+            self.started = True
+            self.shown = self.text
+            self.message = await self.outbox.send(self.channel, self.text)
+            self.last_edit = time.monotonic()
+            self.failed = self.message is None     # the outbox already logged why
+            return
+        if final or time.monotonic() - self.last_edit >= self.edit_interval:
+            self.shown = self.text
+            self.last_edit = time.monotonic()
+            self.pending = self.outbox.edit(self.message, self.text)
+
+
+def chunk_text(chunk):
+    """The text parts of a streamed chunk (chunk.text warns about non-text parts like images)"""
+    if not chunk.candidates or chunk.candidates[0].content is None:
+        return ""
+    return "".join(part.text for part in chunk.candidates[0].content.parts or [] if part.text and not part.thought)
+
+
+async def stream_reply(stream, reply):
+    """Feed a Gemini response stream into a StreamingReply and return all the chunks (for images and history).
+
+    Errors before anything was shown are raised so the caller can retry; after that the reply is cut short instead."""
+    chunks = []
+    try:
+        async with aclosing(stream):    # release the chat session's lock even if we stop early
+            async for chunk in stream:
+                chunks.append(chunk)
+                await reply.append(chunk_text(chunk))
+    except Exception:
+        if not reply.started:
+            raise
+        logger.exception("Streamed reply was cut short")
+        await reply.append(" …")
+    await reply.finish()
+    return chunks
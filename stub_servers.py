@@ -0,0 +1,161 @@
+# stub_servers.py
+# Local stand-ins for the Gemini and Tenor APIs, so the bot can be load-tested with no network
+#
+# Usage:
+#   python3 stub_servers.py [--port 8765] [--gemini-latency 0.5] [--rate-limit 0.02] [--key-rpm 15]
+# then start the bot (or benchmark.py load) with
+#   GEMINI_BASE_URL=http://127.0.0.1:8765/ TENOR_SEARCH_URL=http://127.0.0.1:8765/v2/search
+
+import argparse
+import asyncio
+import base64
+import json
+import random
+import time
+from collections import defaultdict, deque
+from aiohttp import web
+
+# The smallest valid PNG and GIF (1x1 pixel), so image replies exercise the attachment path
+tiny_png = base64.b64decode(
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNk+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg=="
+)
+tiny_gif = base64.b64decode("R0lGODlhAQABAIAAAAAAAP///yH5BAEAAAAALAAAAAABAAEAAAIBRAA7")
+
+
+class StubServers:
+    """One aiohttp app answering Gemini generateContent calls and Tenor searches and downloads"""
+
+    def __init__(self, gemini_latency=0.5, image_latency=2.0, tenor_latency=0.05, rate_limit=0.0,
+                 reply_chars=400, key_rpm=0, seed=0):
+        self.gemini_latency = gemini_latency    # mean seconds per chat answer
+        self.image_latency = image_latency      # mean seconds per image answer
+        self.tenor_latency = tenor_latency
+        self.rate_limit = rate_limit            # fraction of Gemini calls answered with 429
+        self.reply_chars = reply_chars
+        self.key_rpm = key_rpm                  # requests per minute each API key gets per model, 0 for no quota
+        self.key_calls = defaultdict(deque)     # "key/model" -> times of the calls in the last minute
+        self.random = random.Random(seed)
+        self.counts = {"generate": 0, "rate_limited": 0, "search": 0, "media": 0, "by_key": defaultdict(int)}
+
+    def app(self):
+        app = web.Application()
+        app.router.add_post("/{version}/models/{action}", self.generate_content)
+        app.router.add_get("/v2/search", self.search)
+        app.router.add_get("/media/{name}", self.media)
+        app.router.add_get("/stats", self.stats)
+        return app
+
+    async def _sleep(self, mean):
+        # Exponential service times give the long tail real APIs have
+        if mean > 0:
+            await asyncio.sleep(self.random.expovariate(1 / mean))
+
+    async def generate_content(self, request):
+        """POST /v1beta/models/<model>:generateContent (or :streamGenerateContent?alt=sse)"""
+        model, _, method = request.match_info["action"].partition(":")
+        body = await request.json()
+        self.counts["generate"] += 1
+        quota_key = request.headers.get("x-goog-api-key", "") + "/" + model
+        self.counts["by_key"][quota_key] += 1
+        if self.random.random() < self.rate_limit or self._over_quota(quota_key):
+            self.counts["rate_limited"] += 1
+            return web.json_response({"error": {
+                "code": 429,
+                "message": "Resource has been exhausted (stub)",
+                "status": "RESOURCE_EXHAUSTED",
+                "details": [{"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": "1s"}],
+            }}, status=429)
+
+        wants_image = "IMAGE" in [modality.upper() for modality in
+                                  body.get("generationConfig", {}).get("responseModalities", [])]
+        if "image-generation" in model and body.get("systemInstruction"):
+            # Like the real image generation model, which doesn't take developer instructions
+            return web.json_response({"error": {
+                "code": 400,
+                "message": f"Developer instruction is not enabled for models/{model}",
+                "status": "INVALID_ARGUMENT",
+            }}, status=400)
+        latency = self.image_latency if wants_image else self.gemini_latency
+        words = ["stub"] * max(1, self.reply_chars // 5)
+        text = f"[{model}] " + " ".join(words)
+        image = {"inlineData": {"mimeType": "image/png", "data": base64.b64encode(tiny_png).decode()}}
+        if method == "streamGenerateContent":
+            return await self._stream(request, text, image if wants_image else None, latency)
+
+        await self._sleep(latency)
+        parts = [{"text": text}] + ([image] if wants_image else [])
+        return web.json_response(self._response(parts))
+
+    def _over_quota(self, quota_key):
+        """Per key and model requests-per-minute quota, like Gemini's free tier"""
+        if not self.key_rpm:
+            return False
+        calls = self.key_calls[quota_key]
+        now = time.monotonic()
+        while calls and calls[0] <= now - 60:
+            calls.popleft()
+        if len(calls) >= self.key_rpm:
+            return True
+        calls.append(now)
+        return False
+
+    def _response(self, parts):
+        tokens = sum(len(part.get("text", "")) for part in parts) // 4 + 1
+        return {"candidates": [{"content": {"role": "model", "parts": parts}, "finishReason": "STOP", "index": 0}],
+                "usageMetadata": {"candidatesTokenCount": tokens, "totalTokenCount": tokens}}
+
+    async def _stream(self, request, text, image, latency, chunks=8):
+        """Server-sent events: the first chunk after a fifth of the latency, the rest spread over the remainder"""
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        await self._sleep(latency / 5)
+        size = len(text) // chunks + 1
+        for start in range(0, len(text), size):
+            parts = [{"text": text[start:start + size]}]
+            if image is not None and start + size >= len(text):
+                parts.append(image)
+            await response.write(f"data: {json.dumps(self._response(parts))}\r\n\r\n".encode())
+            await self._sleep(latency * 4 / 5 / chunks)
+        await response.write_eof()
+        return response
+
+    async def search(self, request):
+        """GET /v2/search?q=term&limit=N, with media urls pointing back at this server"""
+        self.counts["search"] += 1
+        await self._sleep(self.tenor_latency)
+        term = request.query.get("q", "gif")
+        limit = int(request.query.get("limit", "8"))
+        base = f"{request.scheme}://{request.host}"
+        return web.json_response({"results": [
+            {"media_formats": {"gif": {"url": f"{base}/media/{term}-{index}.gif"}}} for index in range(limit)
+        ]})
+
+    async def media(self, request):
+        self.counts["media"] += 1
+        await self._sleep(self.tenor_latency)
+        return web.Response(body=tiny_gif, content_type="image/gif")
+
+    async def stats(self, request):
+        return web.json_response(self.counts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Gemini and Tenor stubs for load tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--gemini-latency", type=float, default=0.5, help="mean seconds per chat answer")
+    parser.add_argument("--image-latency", type=float, default=2.0, help="mean seconds per image answer")
+    parser.add_argument("--tenor-latency", type=float, default=0.05, help="mean seconds per Tenor call")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="fraction of Gemini calls answered with 429")
+    parser.add_argument("--reply-chars", type=int, default=400)
+    parser.add_argument("--key-rpm", type=int, default=0, help="requests per minute per API key and model (0: no quota)")
+    args = parser.parse_args()
+    stubs = StubServers(gemini_latency=args.gemini_latency, image_latency=args.image_latency,
+                        tenor_latency=args.tenor_latency, rate_limit=args.rate_limit, reply_chars=args.reply_chars,
+                        key_rpm=args.key_rpm)
+    print(f"Stub Gemini/Tenor listening on http://{args.host}:{args.port}/")
+    web.run_app(stubs.app(), host=args.host, port=args.port, print=None, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
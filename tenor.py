@@ -0,0 +1,115 @@
+# tenor.py
+# Tenor GIF search with cached results, cached GIF bytes and optional prefetching
+
+import asyncio
+import logging
+import random
+import string
+from collections import Counter
+import http_client
+from caches import TTLCache, ByteLRUCache
+
+SEARCH_URL = "https://tenor.googleapis.com/v2/search"
+CLIENT_KEY = "marcus_bot_app"
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_term(term):
+    """Lowercase a search term and strip surrounding punctuation so "Game!" and "game" share a cache entry"""
+    return term.strip().strip(string.punctuation).lower()
+
+
+class TenorClient:
+    """Searches Tenor and downloads GIFs, answering from memory whenever it can"""
+
+    def __init__(self, api_key, limit=8, search_ttl=3600, max_searches=512, max_gif_bytes=32 * 1024 * 1024,
+                 search_url=None):
+        self.api_key = api_key
+        self.search_url = search_url or SEARCH_URL          # overridden to point at a local stub in load tests
+        self.limit = limit                                   # how many GIFs are loaded per search
+        self.searches = TTLCache(max_entries=max_searches, ttl=search_ttl)
+        self.gifs = ByteLRUCache(max_bytes=max_gif_bytes)
+        self.term_counts = Counter()                         # how often each term is asked for
+        self._pending = {}                                   # url -> background download task
+
+    async def search(self, term):
+        """Return the list of GIF urls for a search term"""
+        term = normalize_term(term)
+        self._count(term)
+        urls = self.searches.get(term)
+        if urls is None:
+            urls = await self._fetch_search(term)
+        return urls
+
+    async def fetch_gif(self, url):
+        """Return the bytes of a GIF, downloading it only if it isn't cached"""
+        data = self.gifs.get(url)
+        if data is None:
+            data = await http_client.get_bytes(url)
+            self.gifs.set(url, data)
+        return data
+
+    async def random_gif(self, term):
+        """Pick one of the top results for a term and return (url, bytes), or None if nothing was found"""
+        urls = await self.search(term)
+        if not urls:
+            return None
+        url = random.choice(urls)
+        cached = [cached_url for cached_url in urls if cached_url in self.gifs]
+        if url not in self.gifs and cached:
+            # Reply with a GIF we already hold and download the picked one in the background,
+            # so the reply needs no network round trip and the choice still grows over time
+            self._download_later(url)
+            url = random.choice(cached)
+        return url, await self.fetch_gif(url)
+
+    async def prefetch_loop(self, top_terms=10, interval=600):
+        """Keep search results and GIF bytes warm for the most requested terms"""
+        while True:
+            await asyncio.sleep(interval)
+            for term, _ in self.term_counts.most_common(top_terms):
+                try:
+                    # Refresh results that are missing or will expire before the next pass
+                    if self.searches.expires_in(term) < interval:
+                        await self._fetch_search(term)
+                    for url in self.searches.get(term) or []:
+                        if url not in self.gifs:
+                            await self.fetch_gif(url)
+                except Exception as e:
+                    logger.warning("Tenor prefetch failed", extra={"term": term, "error": str(e)})
+
+    def stats(self):
+        return {"searches": self.searches.stats(), "gifs": self.gifs.stats()}
+
+    def clear(self):
+        self.searches.clear()
+        self.gifs.clear()
+
+    async def _fetch_search(self, term):
+        results = await http_client.get_json(
+            self.search_url,
+            params={"q": term, "key": self.api_key, "client_key": CLIENT_KEY, "limit": self.limit},
+        )
+        urls = [result["media_formats"]["gif"]["url"] for result in (results or {}).get("results", [])]
+        self.searches.set(term, urls)
+        return urls
+
+    def _download_later(self, url):
+        if url in self._pending:
+            return
+        task = asyncio.create_task(self.fetch_gif(url))
+        self._pending[url] = task
+        task.add_done_callback(self._download_done)
+
+    def _download_done(self, task):
+        for url, pending in list(self._pending.items()):
+            if pending is task:
+                del self._pending[url]
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("Background GIF download failed", extra={"error": str(task.exception())})
+
+    def _count(self, term):
+        self.term_counts[term] += 1
+        if len(self.term_counts) > 2000:    # keep the popularity table from growing forever
+            self.term_counts = Counter(dict(self.term_counts.most_common(1000)))
@@ -0,0 +1,123 @@
+# workqueue.py
+# Bounded work queues per kind of request (chat, image), served round-robin across users
+
+import asyncio
+import contextvars
+import logging
+import time
+from collections import OrderedDict, deque
+import logs
+import metrics
+
+logger = logging.getLogger(__name__)
+
+queue_wait = metrics.histogram("marcus_queue_wait_seconds", "Time requests spent waiting in a work queue")
+queue_rejected = metrics.counter("marcus_queue_rejected_total", "Requests turned away because a work queue was full")
+
+
+class QueueFullError(Exception):
+    """Raised when a work queue (or one user's share of it) has no room"""
+
+    def __init__(self, queue, per_user):
+        super().__init__(f"{queue} queue is full" + (" for this user" if per_user else ""))
+        self.per_user = per_user
+
+
+class WorkItem:
+    def __init__(self, func):
+        self.func = func
+        self.context = contextvars.copy_context()   # the submitter's request id, for the logs func writes
+        self.future = asyncio.get_running_loop().create_future()
+        self.queued_at = time.monotonic()
+
+
+class WorkQueue:
+    """A fixed number of workers serving a bounded queue; users take turns so one user's burst can't crowd out others"""
+
+    def __init__(self, name, workers=2, max_size=50, max_per_user=3, priority=0):
+        self.name = name
+        self.workers = workers
+        self.max_size = max_size
+        self.max_per_user = max_per_user
+        self.priority = priority        # passed on to the scheduler; lower numbers get scarce slots first
+        self.users = OrderedDict()      # user id -> deque of WorkItem, in the order users get their next turn
+        self.depth = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self._ready = None              # counts queued items; created with the workers inside the event loop
+        self._tasks = []
+
+    def submit(self, user_id, func):
+        """Queue func for a user. Returns (future, position), position 0 meaning a worker is free for it.
+        Raises QueueFullError instead of queueing without bound."""
+        user_items = self.users.get(user_id)
+        per_user = user_items is not None and len(user_items) >= self.max_per_user
+        if per_user or self.depth >= self.max_size:
+            self.rejected += 1
+            queue_rejected.inc(queue=self.name)
+            raise QueueFullError(self.name, per_user)
+        if not self._tasks:
+            self._start()
+        if user_items is None:
+            user_items = self.users[user_id] = deque()
+        item = WorkItem(func)
+        user_items.append(item)
+        self.depth += 1
+        self._ready.release()
+        # Round-robin: everyone else gets up to as many turns as this user has items queued
+        turn = len(user_items)
+        ahead = sum(min(len(items), turn) for user, items in self.users.items() if user != user_id) + turn - 1
+        position = max(0, ahead - (self.workers - self.running) + 1)
+        return item.future, position
+
+    def _start(self):
+        self._ready = asyncio.Semaphore(0)
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    def _next(self):
+        user_id, items = next(iter(self.users.items()))
+        item = items.popleft()
+        if items:
+            self.users.move_to_end(user_id)     # back of the line for this user's next item
+        else:
+            del self.users[user_id]
+        self.depth -= 1
+        return item
+
+    async def _work(self):
+        logs.request_id.set(None)   # the worker serves many messages, not the one that started it
+        while True:
+            await self._ready.acquire()
+            item = self._next()
+            if item.future.done():      # the requester gave up while waiting
+                continue
+            queue_wait.observe(time.monotonic() - item.queued_at, queue=self.name)
+            self.running += 1
+            try:
+                result = await asyncio.create_task(item.func(), context=item.context)
+            except Exception as e:
+                if not item.future.done():
+                    item.future.set_exception(e)
+            else:
+                if not item.future.done():
+                    item.future.set_result(result)
+            finally:
+                self.running -= 1
+                self.completed += 1
+
+    def stats(self):
+        return {
+            "depth": self.depth,
+            "running": self.running,
+            "workers": self.workers,
+            "max_size": self.max_size,
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []